@@ -51,17 +51,52 @@ dz = X[1]-X[0]
 
 ovf2io.write_ovf_rectangular(f, "file.ovf", p0=(xmin, ymin, zmin), cellsize=(dx, dy, dz))
 ```
+
+4. Time each phase of a read or write. 
+```python
+with ovf2io.PhaseCounters() as counters:
+    ovf2io.read_ovf("file.ovf")
+print(counters.as_dict()) # {'header': {'calls': 1, 'seconds': ..., 'nbytes': ..., 'allocated': 0}, ...}
+```
+
+5. Read only the header, and a single component. 
+```python
+f = ovf2io.open_ovf("file.ovf")
+print(f.metadata['title'])
+print(f['m_z']) # only m_z is decoded
+```
 """
 from . import _utils as ut
+from ._instrument import add_observer, remove_observer, PhaseCounters, _phase
+from ._convert import convert_ovf
+from ._watch import watch_ovf
+from ._validate import validate_ovf
+from ._spatial import IrregularMesh
+from ._archive import OVFArchive
+from ._lazy import open_ovf, OVFFile
+from ._resample import _read_resampled
+import os
 import numpy as np
 from pathlib import Path
 from warnings import warn
 
 __all__ = ["read_ovf",
            "write_ovf_irregular",
-           "write_ovf_rectangular"]
-
-def read_ovf(fname):
+           "write_ovf_rectangular",
+           "write_ovf_masked",
+           "read_ovf_masked",
+           "add_observer",
+           "remove_observer",
+           "PhaseCounters",
+           "convert_ovf",
+           "watch_ovf",
+           "validate_ovf",
+           "IrregularMesh",
+           "OVFArchive",
+           "open_ovf",
+           "OVFFile"]
+
+def read_ovf(fname, order="xyz", native=False, dtype=None, workers=None, resample=None):
     """Returns a dictionary containing the information read from an .ovf file.
     
     The returned dictionary has three items: 
@@ -78,14 +113,55 @@ def read_ovf(fname):
     `read_ovf(fname)['coords']['x']`
 
     If meshtype is `'rectangular'`, the shape of each `'data'` entry and each `'coords'` 
-    entry will be `(xnodes, ynodes, znodes)`. If meshtype is `'irregular'`, each 
-    `'data'` and `'coords'` entry will be 1-dimensional. 
+    entry will be `(xnodes, ynodes, znodes)`, or the same axes in the given **order**. 
+    If meshtype is `'irregular'`, each `'data'` and `'coords'` entry will be 1-dimensional. 
+
+    OVF 1.0 files are also read. Their header is completed with `valuedim` 3, 
+    `valuelabels` "value_0 value_1 value_2" and `valueunits` from `valueunit`, and 
+    the data values are multiplied by `valuemultiplier`. Their binary data is 
+    big-endian, and is returned as big-endian arrays (which numpy handles 
+    transparently) unless **native** is `True`. 
 
     **Parameters**
 
     * **fname** : _str or Path_ <br />
     The filename. <br />
 
+    * **order** : _str, optional_ <br />
+    Order of the axes of rectangular-mesh arrays, e.g. "yxz" to match `np.meshgrid`'s 
+    default indexing and `plt.imshow`. The arrays are views, so no data is copied. <br />
+    Default is `order = "xyz"`. 
+
+    * **native** : _bool, optional_ <br />
+    If `True`, big-endian (OVF 1.0) binary data is byteswapped in place to the 
+    native byte order. <br />
+    Default is `native = False`. 
+
+    * **dtype** : _data-type, optional_ <br />
+    Convert the data to this type while reading, e.g. `np.float64` for `Binary 4` 
+    files. `None` keeps the type of the file. <br />
+    Default is `dtype = None`. 
+
+    * **workers** : _int, optional_ <br />
+    Number of threads used to read a binary data block. Each thread reads its own 
+    range of the block with positioned reads, and does any **dtype** or **native** 
+    conversion of that range, straight into a single output array. This speeds up 
+    reading very large files on fast storage. Text data is always read by one thread. <br />
+    Default is `workers = None`, a single thread, in which case files of up to 1 MiB 
+    are read whole, with a single call, and parsed in memory. 
+
+    * **resample** : _dict, optional_ <br />
+    Resample a rectangular mesh onto a grid covering the same region, e.g. 
+    `resample=dict(cellsize=(4e-9, 4e-9, 4e-9), method="block_mean")`. Give either 
+    `'cellsize'` (a float or a tuple, adjusted to fit a whole number of cells) or 
+    `'shape'` `(N_x, N_y, N_z)`. `'method'` is one of "nearest", "linear" and 
+    "block_mean" (the mean of the overlapping cells, weighted by overlap); 
+    the default is "linear". The data block is streamed a few z-planes at a time 
+    (about `'chunk_bytes'`, default `2**26`), so only the resampled arrays are held 
+    in memory. The header and coordinates describe the new grid, and the data is 
+    in the native byte order. <br />
+    Default is `resample = None`. 
+
     **Returns**
 
     * **file_dict** : _dict_ <br />
@@ -94,23 +170,12 @@ def read_ovf(fname):
     """
     fname = Path(fname)
     with open(fname, "rb") as f:
-        if not b"2.0" in next(f):
-            raise ValueError("This file does not appear to be OVF 2.0. "
-                             "ovf2io does not support older OVF formats. ")
-        # Skip ahead to the header
-        while b"# begin: header" not in next(f).lower():
-            pass
-        header = ut._parse_header(f)
-        nbytes = ut._advance_to_data_block(f)
-        data = ut._parse_data(f, header, nbytes)
-    coords = ut._gen_coords(data, header)
-    header['repr'] = "text" if nbytes is None else f"Binary {nbytes}"
-    out = {
-            'data': data,
-            'coords': coords,
-            'metadata': header
-        }
-    return out
+        if resample is not None:
+            return _read_resampled(f, resample, order, dtype)
+        size = os.fstat(f.fileno()).st_size
+        if workers is None and size <= ut._small_file_bytes:
+            return ut._read_small(f, size, order, native, dtype)
+        return ut._read_segment(f, order, native, dtype, workers)
 
 def write_ovf(data, fname, **kwargs):
     """Write data to an OOMMF Vector Field (.ovf) file. 
@@ -131,7 +196,7 @@ def write_ovf(data, fname, **kwargs):
 
 def write_ovf_rectangular(data, fname, p0=(0., 0., 0.,), cellsize=None,
         x=None, y=None, z=None, title="title", desc=[], meshunit="m",
-        valueunits=[], valuelabels=[], representation="bin8",
+        valueunits=[], valuelabels=[], representation="bin8", order="xyz",
     ):
     """Write data from a rectangular mesh to an OOMMF Vector Field (.ovf) file.
 
@@ -141,6 +206,7 @@ def write_ovf_rectangular(data, fname, p0=(0., 0., 0.,), cellsize=None,
     Data should have shape `(N_x, N_y, N_z, N_data_components)`. For example, 
     a vector field with 3 components, 10 samples in the x-direction, 5 samples 
     in the y-direction, and 2 samples in the z-direction would have shape (10, 5, 2, 3). 
+    The first three axes can be given in another order with **order**. 
 
     * **fname** : _str or Path_ <br />
     The name of the file to write. Will be overwritten if it exists already. 
@@ -197,46 +263,18 @@ def write_ovf_rectangular(data, fname, p0=(0., 0., 0.,), cellsize=None,
     Comments are allowed in text mode, which uses the UTF-8 encoding. 
     Note that the original specification specifies ASCII which is a subset of UTF-8. <br />
     Default is `representation = "bin8"`. 
-    """
-    data = np.array(data)
-    if len(data.shape) != 4:
-        raise Exception("Data should have shape (N_x, N_y, N_z, N_data_components).")
 
-    # Add a line to desc saying generated by ovf2io
-    desc = ut._shape_desc(desc)
-    valuedim = data.shape[-1]
-
-    # Generate valueunits and valuelabels
-    valueunits = ut._generate_valueunits_list(valueunits, valuedim)
-    valuelabels = ut._generate_valuelabels_list(valuelabels, valuedim)
-
-    if x is not None and y is not None and z is not None:
-        if len(x) != data.shape[0] or len(y) != data.shape[1] or len(z) != data.shape[2]:
-            raise ValueError("Coordinate dimensions incorrect; lengths of x, y, and z "
-                             "should match the data's first, second, and third axes, respectively. ")
-        p0 = (x[0], y[0], z[0])
-        cellsize = (np.abs(x[1]-x[0]), np.abs(y[1]-y[0]), np.abs(z[1]-z[0]))
-    elif x is not None or y is not None or z is not None:
-        raise Exception("x, y, and z should all be given or none given.")
-    # If no x/y/z, but also no cellsize
-    elif cellsize is None:
-        cellsize = (1., 1., 1.)
-        meshunit = "pt"
-    header = {
-        "title": title, "desc": desc, "meshunit": meshunit, "meshtype": "rectangular",
-        "valueunits": valueunits, "valuelabels": valuelabels, "valuedim": valuedim,
-        "xbase": p0[0], "ybase": p0[1], "zbase": p0[2], 
-        "xstepsize": cellsize[0], "ystepsize": cellsize[1], "zstepsize": cellsize[2],
-        "xnodes": data.shape[0], "ynodes": data.shape[1], "znodes": data.shape[2],
-        "xmin": p0[0] - 0.5 * cellsize[0], "xmax": p0[0] + (data.shape[0] - 0.5) * cellsize[0],
-        "ymin": p0[1] - 0.5 * cellsize[1], "ymax": p0[1] + (data.shape[1] - 0.5) * cellsize[1],
-        "zmin": p0[2] - 0.5 * cellsize[2], "zmax": p0[2] + (data.shape[2] - 0.5) * cellsize[2]
-    }
-    if not representation.lower() in {"text", "bin4", "bin8"}:
-        raise ValueError("Representation must be either 'text', 'bin4', or 'bin8'.")
-    reshaped = data.reshape((-1, data.shape[-1]), order='F')
-    frontmatter = ut._make_header(header, representation)
-    ut._write_file(fname, frontmatter, representation, reshaped)
+    * **order** : _str, optional_ <br />
+    Order of the first three axes of **data**, e.g. "yxz" for data of shape 
+    `(N_y, N_x, N_z, N_data_components)`. The data is written in strided pieces, 
+    so it is not copied as a whole to reorder it. <br />
+    Default is `order = "xyz"`. 
+    """
+    header, data = ut._prepare_rectangular(data, p0, cellsize, x, y, z, title, desc, 
+            meshunit, valueunits, valuelabels, representation, order)
+    with _phase("render_header"):
+        frontmatter = ut._make_header(header, representation)
+    ut._write_file(fname, frontmatter, representation, data)
 
 def write_ovf_irregular(data, fname, points=None, cellsize=(0., 0., 0.),
         title="title", desc=[], meshunit="m", 
@@ -287,33 +325,153 @@ def write_ovf_irregular(data, fname, points=None, cellsize=(0., 0., 0.),
     Note that the original specification specifies ASCII which is a subset of UTF-8. <br />
     Default is `representation = "bin8"`. 
     """
-    data = np.array(data)
-    if len(data.shape) != 2:
-        raise Exception("Data should have shape (N_points, N_data_components).")
-
-    # Add a line to desc saying generated by ovf2io
-    desc = ut._shape_desc(desc)
-    valuedim = data.shape[-1]
-    valueunits = ut._generate_valueunits_list(valueunits, valuedim)
-    valuelabels = ut._generate_valuelabels_list(valuelabels, valuedim)
-
-    if points is None:
-        points = np.array([[i, 0., 0.] for i in range(data.shape[0])])
+    header, reshaped = ut._prepare_irregular(data, points, cellsize, title, desc, 
+            meshunit, valueunits, valuelabels, representation)
+    with _phase("render_header"):
+        frontmatter = ut._make_header(header, representation)
+    ut._write_file(fname, frontmatter, representation, reshaped)
+
+def write_ovf_masked(data, mask, fname, p0=(0., 0., 0.), cellsize=None,
+        title="title", desc=[], meshunit="m",
+        valueunits=[], valuelabels=[], representation="bin8", order="xyz"
+    ):
+    """Write the unmasked cells of a rectangular mesh to an irregular-mesh .ovf file. 
+
+    Useful for geometries that are mostly empty, since only the unmasked cells are 
+    stored, each with its coordinates. The rectangular grid is recorded in a `desc` 
+    line, so that `read_ovf_masked()` can restore the full array. 
+
+    **Parameters**
+
+    * **data** : _ndarray_ <br />
+    Data should have shape `(N_x, N_y, N_z, N_data_components)`, 
+    as for `write_ovf_rectangular()`. 
+
+    * **mask** : _ndarray_ <br />
+    Boolean array of shape `(N_x, N_y, N_z)`. As for numpy masked arrays, 
+    cells where **mask** is `True` are left out; at least one cell must be kept. 
+
+    * **fname** : _str or Path_ <br />
+    The name of the file to write. Will be overwritten if it exists already. 
+    Intermediate directories are not created automatically. 
+
+    * **p0** : _tuple, optional_ <br />
+    The coordinates of the first grid point, in units of `meshunit`. <br />
+    Default is `p0=(0., 0., 0.)`. 
+
+    * **cellsize** : _tuple, optional_ <br />
+    The distance between adjacent grid points, in units of `meshunit`. <br />
+    Default is `cellsize=(1., 1., 1.)`.
+
+    * **title**, **desc**, **meshunit**, **valueunits**, **valuelabels**, **representation**, **order** <br />
+    As for `write_ovf_rectangular()`. **order** applies to both **data** and **mask**. 
+    """
+    data = np.asarray(data)
+    mask = np.asarray(mask, dtype=bool)
+    if len(data.shape) != 4:
+        raise Exception("Data should have shape (N_x, N_y, N_z, N_data_components).")
+    if order != "xyz":
+        ut._axes_permutation(order)
+        data = data.transpose(tuple(order.index(axis) for axis in "xyz") + (3,))
+        mask = mask.transpose(tuple(order.index(axis) for axis in "xyz"))
+    if mask.shape != data.shape[:3]:
+        raise ValueError("Mask should have shape (N_x, N_y, N_z), matching the data. ")
+    if mask.all():
+        raise ValueError("Mask excludes every cell, so there are no points to write. ")
+    if cellsize is None:
         cellsize = (1., 1., 1.)
         meshunit = "pt"
+    # Transposing first keeps the OVF ordering of the points, x varying fastest
+    k, j, i = np.nonzero(~mask.transpose(2, 1, 0))
+    points = np.stack((i, j, k), axis=-1) * np.asarray(cellsize, dtype=float) + np.asarray(p0, dtype=float)
+    desc = list(desc) + [ut._masked_grid_desc(data.shape, p0, cellsize)]
+    write_ovf_irregular(data[i, j, k], fname, points=points, cellsize=cellsize,
+            title=title, desc=desc, meshunit=meshunit, valueunits=valueunits,
+            valuelabels=valuelabels, representation=representation)
+
+def read_ovf_masked(fname, p0=None, cellsize=None, shape=None, fill_value=0., order="xyz"):
+    """Read an irregular-mesh .ovf file into arrays on a rectangular grid. 
+
+    The inverse of `write_ovf_masked()`. Each point is placed in the grid cell 
+    nearest to it; cells without a point are set to **fill_value** and masked. 
+    For files written by `write_ovf_masked()` the grid is read from the file, 
+    otherwise at least **cellsize** must be given. 
 
-    header = {
-        "title": title, "desc": desc, "meshunit": meshunit, "meshtype": "irregular",
-        "valueunits": valueunits, "valuelabels": valuelabels, "valuedim": valuedim,
-        "pointcount": data.shape[0],
-        "xmin": np.min(points[:,0]) - 0.5 * cellsize[0], "xmax": np.max(points[:,0]) + 0.5 * cellsize[0],
-        "ymin": np.min(points[:,1]) - 0.5 * cellsize[1], "ymax": np.max(points[:,1]) + 0.5 * cellsize[1],
-        "zmin": np.min(points[:,2]) - 0.5 * cellsize[2], "zmax": np.max(points[:,2]) + 0.5 * cellsize[2],
-    }
-    if not representation.lower() in {"text", "bin4", "bin8"}:
-        raise ValueError("Representation must be either 'text', 'bin4', or 'bin8'.")
-    reshaped = np.zeros((data.shape[0], data.shape[1] + 3))
-    reshaped[:, :3] = points
-    reshaped[:, 3:] = data
-    frontmatter = ut._make_header(header, representation)
-    ut._write_file(fname, frontmatter, representation, reshaped)
+    **Parameters**
+
+    * **fname** : _str or Path_ <br />
+    The filename. 
+
+    * **p0** : _tuple, optional_ <br />
+    The coordinates of the first grid point. 
+    Default is the smallest x, y, and z of the points. 
+
+    * **cellsize** : _tuple, optional_ <br />
+    The distance between adjacent grid points. 
+
+    * **shape** : _tuple, optional_ <br />
+    The number of grid points `(N_x, N_y, N_z)`. 
+    Default is the smallest grid that contains all of the points. 
+
+    * **fill_value** : _float, optional_ <br />
+    Value of cells that contain no point. <br />
+    Default is `fill_value = 0.`. 
+
+    * **order** : _str, optional_ <br />
+    Order of the axes of the returned arrays, as for `read_ovf()`. 
+    **shape** is always given as `(N_x, N_y, N_z)`. <br />
+    Default is `order = "xyz"`. 
+
+    **Returns**
+
+    * **file_dict** : _dict_ <br />
+    As for `read_ovf()` on a rectangular mesh, with `'data'` and `'coords'` entries 
+    of shape `(N_x, N_y, N_z)`, plus `'mask'`, which is `True` for cells without a point. 
+    """
+    irregular = read_ovf(fname)
+    header = irregular['metadata']
+    if header['meshtype'] != 'irregular':
+        raise ValueError("read_ovf_masked() requires a file with an irregular mesh. ")
+    points = np.stack([irregular['coords'][axis] for axis in "xyz"], axis=-1)
+    grid = ut._parse_masked_grid_desc(header)
+    if grid is not None:
+        p0 = p0 if p0 is not None else (grid['xbase'], grid['ybase'], grid['zbase'])
+        cellsize = cellsize if cellsize is not None else (
+                grid['xstepsize'], grid['ystepsize'], grid['zstepsize'])
+        shape = shape if shape is not None else (grid['xnodes'], grid['ynodes'], grid['znodes'])
+    elif cellsize is None:
+        raise ValueError("cellsize must be given for files not written by write_ovf_masked(). ")
+    if p0 is None:
+        p0 = points.min(axis=0)
+    p0 = np.asarray(p0, dtype=float)
+    cellsize = np.asarray(cellsize, dtype=float)
+    indices = np.rint((points - p0) / cellsize).astype(np.intp)
+    if shape is None:
+        shape = tuple(indices.max(axis=0) + 1)
+    if (indices < 0).any() or (indices >= np.asarray(shape)).any():
+        raise ValueError("Some points lie outside of the given grid. ")
+    i, j, k = indices.T
+    data = {}
+    for key, values in irregular['data'].items():
+        data[key] = np.full(shape, fill_value, dtype=values.dtype)
+        data[key][i, j, k] = values
+    mask = np.ones(shape, dtype=bool)
+    mask[i, j, k] = False
+    grid = {"meshtype": "rectangular",
+            "xnodes": shape[0], "ynodes": shape[1], "znodes": shape[2],
+            "xstepsize": cellsize[0], "ystepsize": cellsize[1], "zstepsize": cellsize[2],
+            "xmin": p0[0] - 0.5 * cellsize[0], "ymin": p0[1] - 0.5 * cellsize[1],
+            "zmin": p0[2] - 0.5 * cellsize[2]}
+    coords = ut._gen_coords(data, grid)
+    if order != "xyz":
+        axes = ut._axes_permutation(order)
+        data = {key: value.transpose(axes) for key, value in data.items()}
+        coords = {key: value.transpose(axes) for key, value in coords.items()}
+        mask = mask.transpose(axes)
+    out = {
+            'data': data,
+            'coords': coords,
+            'metadata': header,
+            'mask': mask
+        }
+    return out
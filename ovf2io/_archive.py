@@ -0,0 +1,216 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import re
+from pathlib import Path
+import numpy as np
+from . import _utils as ut
+from ._instrument import _phase
+
+# One record per frame of the archive. `shape` is that of the data block, as in
+# `_utils._data_shape()`, padded with ones; `nbytes` is 0 for text.
+_index_dtype = np.dtype([("header_offset", "<i8"), ("data_offset", "<i8"), ("end_offset", "<i8"),
+                         ("nbytes", "<i8"), ("shape", "<i8", (4,)), ("time", "<f8")])
+
+_time_pattern = re.compile(r"total simulation time:\s*([-+0-9.eE]+)", re.IGNORECASE)
+
+def _frame_time(header):
+    """Simulation time from a 'Total simulation time' desc line (as written by mumax3), or NaN."""
+    for line in header.get("desc", []):
+        match = _time_pattern.search(line)
+        if match is not None:
+            return float(match.group(1))
+    return np.nan
+
+def _index_record(shape, nbytes, header_offset, data_offset, end_offset, time):
+    record = np.zeros(1, dtype=_index_dtype)
+    record["header_offset"] = header_offset
+    record["data_offset"] = data_offset
+    record["end_offset"] = end_offset
+    record["nbytes"] = nbytes or 0
+    record["shape"] = tuple(shape) + (1,) * (4 - len(shape))
+    record["time"] = time
+    return record
+
+def _scan(fname):
+    """Rebuild the index of an archive by reading the headers of all its segments."""
+    records = []
+    with open(fname, "rb") as f:
+        while True:
+            header_offset = f.tell()
+            first = f.readline()
+            if not first:
+                break
+            if not first.strip():
+                continue
+            f.seek(header_offset)
+            header = ut._read_header(f)
+            nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+            data_offset = f.tell()
+            expected = ut._data_block_nbytes(header, nbytes)
+            if expected is not None:
+                f.seek(data_offset - nbytes + expected)
+            for line in f:
+                if line.lower().startswith(b"# end: seg"):
+                    break
+            shape, keys = ut._data_shape(header)
+            records.append(_index_record(shape, nbytes, header_offset, data_offset,
+                                         f.tell(), _frame_time(header)))
+    return np.concatenate(records) if records else np.zeros(0, dtype=_index_dtype)
+
+class OVFArchive:
+    """Many snapshots concatenated into one file, with a sidecar index for random access.
+
+    Each snapshot (frame) is stored as a complete OVF 2.0 segment, so that
+    `archive.extract(i, fname)` gives a valid .ovf file. The index, stored next to
+    the archive as `fname + ".idx"`, holds the offsets, shape, representation and
+    simulation time of each frame, so `archive[i]` and `archive[i:j]` only read the
+    requested frames. If the index is missing, it is rebuilt from the archive.
+
+    ```python
+    with ovf2io.OVFArchive("run.ovfa", mode="w") as archive:
+        for t, m in simulation:
+            archive.append(m, time=t, cellsize=(1e-9, 1e-9, 1e-9))
+
+    archive = ovf2io.OVFArchive("run.ovfa")
+    m_z = archive[-1]['data']['value_2']
+    ```
+
+    **Parameters**
+
+    * **fname** : _str or Path_ <br />
+    The archive file.
+
+    * **mode** : _str, optional_ <br />
+    "r" to read, "a" to read and append, "w" to start a new archive,
+    overwriting any existing one. <br />
+    Default is `mode = "r"`.
+    """
+    def __init__(self, fname, mode="r"):
+        if mode not in {"r", "a", "w"}:
+            raise ValueError("Mode must be either 'r', 'a', or 'w'.")
+        self.fname = Path(fname)
+        self.index_fname = Path(str(fname) + ".idx")
+        self.mode = mode
+        if mode == "w":
+            open(self.fname, "wb").close()
+            open(self.index_fname, "wb").close()
+        if self.index_fname.exists():
+            self.index = np.fromfile(self.index_fname, dtype=_index_dtype)
+        elif self.fname.exists():
+            self.index = _scan(self.fname)
+            if mode != "r":
+                with open(self.index_fname, "wb") as f:
+                    f.write(self.index.tobytes())
+        elif mode == "a":
+            self.index = np.zeros(0, dtype=_index_dtype)
+        else:
+            raise FileNotFoundError(f"No such archive: '{fname}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def times(self):
+        """The simulation time of each frame (NaN where not given)."""
+        return self.index["time"]
+
+    def __getitem__(self, key):
+        """Read frame(s) as for `read_ovf()`: one dict for an int, a list of dicts for a slice."""
+        if isinstance(key, slice):
+            frames = range(len(self))[key]
+            with open(self.fname, "rb") as f:
+                return [self._read_frame(f, i) for i in frames]
+        with open(self.fname, "rb") as f:
+            return self._read_frame(f, key)
+
+    def __iter__(self):
+        with open(self.fname, "rb") as f:
+            for i in range(len(self)):
+                yield self._read_frame(f, i)
+
+    def read(self, key, order="xyz", native=False, dtype=None, workers=None):
+        """Read frame `key` with the options of `read_ovf()`."""
+        with open(self.fname, "rb") as f:
+            return self._read_frame(f, key, order, native, dtype, workers)
+
+    def _read_frame(self, f, i, order="xyz", native=False, dtype=None, workers=None):
+        f.seek(int(self.index[i]["header_offset"]))
+        return ut._read_segment(f, order, native, dtype, workers)
+
+    def extract(self, key, fname):
+        """Copy frame `key` to a standalone .ovf file `fname`."""
+        record = self.index[key]
+        with open(self.fname, "rb") as f:
+            f.seek(int(record["header_offset"]))
+            segment = f.read(int(record["end_offset"] - record["header_offset"]))
+        with open(fname, "wb") as f:
+            f.write(segment)
+
+    def append(self, data, time=None, representation="bin8", **kwargs):
+        """Append a frame, written as by `write_ovf_rectangular()` or `write_ovf_irregular()`.
+
+        **Parameters**
+
+        * **data** : _ndarray_ <br />
+        Rectangular data with shape `(N_x, N_y, N_z, N_data_components)`, or
+        irregular data with shape `(N_points, N_data_components)`.
+
+        * **time** : _float, optional_ <br />
+        Simulation time of the frame, stored in the index and as a
+        "Total simulation time" desc line.
+
+        * **representation** : _str, optional_ <br />
+        One of "text", "bin4", and "bin8". <br />
+        Default is `representation = "bin8"`.
+
+        * **kwargs** <br />
+        Other arguments of `write_ovf_rectangular()` (for 4-dimensional **data**)
+        or `write_ovf_irregular()` (for 2-dimensional **data**).
+        """
+        if self.mode == "r":
+            raise Exception("Archive was opened read-only. ")
+        data = np.asarray(data)
+        if time is not None:
+            kwargs["desc"] = list(kwargs.get("desc", [])) + [f"Total simulation time: {time} s"]
+        if data.ndim == 4:
+            header, rows = ut._prepare_rectangular(data, representation=representation, **kwargs)
+        elif data.ndim == 2:
+            header, rows = ut._prepare_irregular(data, representation=representation, **kwargs)
+        else:
+            raise Exception("Shape of data not recognized. Should be "
+                            "(N_x, N_y, N_z, N_data_components) for rectangular meshes "
+                            "or (N_points, N_data_components) for irregular meshes. ")
+        with _phase("render_header"):
+            frontmatter = ut._make_header(header, representation)
+        with open(self.fname, "ab") as f:
+            header_offset = f.tell()
+            data_offset = ut._write_segment(f, frontmatter, representation, rows)
+            f.write(b"\n")
+            end_offset = f.tell()
+        nbytes = {"text": None, "bin4": 4, "bin8": 8}[representation]
+        # Shape of the data block, as given by `_utils._data_shape()` on reading
+        shape = (rows.shape[-1],) + rows.shape[:-1]
+        record = _index_record(shape, nbytes, header_offset, data_offset, end_offset,
+                               np.nan if time is None else time)
+        with open(self.index_fname, "ab") as f:
+            f.write(record.tobytes())
+        self.index = np.concatenate((self.index, record))
@@ -0,0 +1,153 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Command line interface, installed as the `ovf2io` console script.
+
+```
+ovf2io info run/*.ovf
+ovf2io stats m000123.ovf
+ovf2io convert --format hdf5 --output converted/ --workers 8 run/
+```
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from . import _utils as ut
+from . import _convert
+
+def _expand_paths(paths):
+    """Replace each directory in `paths` by the .ovf files it contains."""
+    out = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            out += sorted(path.glob("*.ovf"))
+        else:
+            out.append(path)
+    return out
+
+def _read_header_only(fname):
+    with open(fname, "rb") as f:
+        header = ut._read_header(f)
+        nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+    header['repr'] = "text" if nbytes is None else f"Binary {nbytes}"
+    return header
+
+def _output_paths(fnames, outdir, format):
+    """Output file of each input, named after its stem.
+
+    Inputs whose stems clash (e.g. `run1/m000000.ovf` and `run2/m000000.ovf`) are 
+    prefixed with the name of their directory. Raises if names still clash. 
+    """
+    stems = [Path(fname).stem for fname in fnames]
+    names = [f"{Path(fname).parent.name}_{stem}" if stems.count(stem) > 1 else stem
+             for fname, stem in zip(fnames, stems)]
+    clashes = sorted({name for name in names if names.count(name) > 1})
+    if clashes:
+        raise ValueError(f"Several inputs would be converted to the same file: {', '.join(clashes)}. ")
+    return [Path(outdir).joinpath(name + _convert._extensions[format]) for name in names]
+
+def _convert_one(fname, dst, format, chunk_bytes):
+    _convert.convert_ovf(fname, dst, format=format, chunk_bytes=chunk_bytes)
+    return dst
+
+def _info(args):
+    status = 0
+    for fname in _expand_paths(args.paths):
+        try:
+            header = _read_header_only(fname)
+        except Exception as e:
+            print(f"{fname}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        print(fname)
+        for key, value in header.items():
+            print(f"    {key}: {value}")
+    return status
+
+def _stats(args):
+    status = 0
+    for fname in _expand_paths(args.paths):
+        try:
+            stats = _convert._component_stats(fname, args.chunk_mb * 2**20)
+        except Exception as e:
+            print(f"{fname}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        print(fname)
+        for label, s in stats.items():
+            print(f"    {label}: count={s['count']} min={s['min']:.6g} max={s['max']:.6g} "
+                  f"mean={s['mean']:.6g} std={s['std']:.6g}")
+    return status
+
+def _convert_all(args):
+    fnames = _expand_paths(args.paths)
+    try:
+        dsts = _output_paths(fnames, args.output, args.format)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    chunk_bytes = args.chunk_mb * 2**20
+    workers = args.workers or os.cpu_count() or 1
+    status = 0
+    if workers == 1:
+        results = []
+        for fname, dst in zip(fnames, dsts):
+            try:
+                results.append(_convert_one(fname, dst, args.format, chunk_bytes))
+            except Exception as e:
+                results.append(e)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_convert_one, fname, dst, args.format, chunk_bytes)
+                       for fname, dst in zip(fnames, dsts)]
+            results = [future.exception() or future.result() for future in futures]
+    for fname, result in zip(fnames, results):
+        if isinstance(result, Exception):
+            print(f"{fname}: {result}", file=sys.stderr)
+            status = 1
+        else:
+            print(f"{fname} -> {result}")
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ovf2io",
+            description="Inspect and convert OOMMF Vector Field (.ovf) files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info = subparsers.add_parser("info", help="print the header of each file")
+    info.add_argument("paths", nargs="+", help=".ovf files or directories of .ovf files")
+    info.set_defaults(func=_info)
+
+    stats = subparsers.add_parser("stats", help="print min/max/mean/std of each data component")
+    stats.add_argument("paths", nargs="+", help=".ovf files or directories of .ovf files")
+    stats.add_argument("--chunk-mb", type=int, default=64,
+                       help="approximate memory used to decode each piece of a file (default 64)")
+    stats.set_defaults(func=_stats)
+
+    convert = subparsers.add_parser("convert", help="convert to .npy, HDF5 or Zarr")
+    convert.add_argument("paths", nargs="+", help=".ovf files or directories of .ovf files")
+    convert.add_argument("-f", "--format", choices=sorted(_convert._openers), default="npy")
+    convert.add_argument("-o", "--output", default=".", help="output directory (default .)")
+    convert.add_argument("-j", "--workers", type=int, default=None,
+                         help="number of worker processes (default: number of CPUs)")
+    convert.add_argument("--chunk-mb", type=int, default=64,
+                         help="approximate memory used per worker (default 64)")
+    convert.set_defaults(func=_convert_all)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,170 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import math
+from pathlib import Path
+import numpy as np
+from . import _utils as ut
+
+_extensions = {"npy": ".npy", "hdf5": ".h5", "zarr": ".zarr"}
+
+def _output_shape(header):
+    """Shape of the converted array.
+
+    `(xnodes, ynodes, znodes, valuedim)` for rectangular meshes, matching
+    `write_ovf_rectangular()`, and `(pointcount, 3 + valuedim)` for irregular
+    meshes, with x, y, z in the first three columns.
+    """
+    shape, keys = ut._data_shape(header)
+    return shape[1:] + shape[:1]
+
+def _attributes(header):
+    attrs = dict(header)
+    if header['meshtype'] == 'irregular':
+        attrs['columns'] = ["x", "y", "z"] + header['valuelabels']
+    return attrs
+
+def _storage_chunks(shape, itemsize, slices, max_bytes=2**22):
+    """Chunk shape of an HDF5 or Zarr array of `shape`, written `slices` at a time along axis -2.
+
+    The chunks span at most `slices` along that axis, and are rounded down to at most 
+    **max_bytes**, shrinking the other axes only if a single slice is too large. Returns 
+    the chunk shape and the number of slices to write at once, a multiple of the chunk 
+    extent along axis -2, so that no chunk is written (and compressed) more than once. 
+    """
+    shape = list(shape)
+    chunks = list(shape)
+    slice_bytes = math.prod(shape[:-2] + shape[-1:]) * itemsize
+    chunks[-2] = max(1, min(slices, shape[-2], max_bytes // max(slice_bytes, 1)))
+    # Slices too large for one chunk: split them along the other axes, the slowest first
+    for axis in reversed(range(len(shape) - 2)):
+        if math.prod(chunks) * itemsize <= max_bytes:
+            break
+        rest = math.prod(chunks) // chunks[axis] * itemsize
+        chunks[axis] = max(1, max_bytes // rest)
+    return tuple(chunks), max(1, slices // chunks[-2]) * chunks[-2]
+
+def _open_npy(dst, shape, dtype, attrs, chunks):
+    array = np.lib.format.open_memmap(dst, mode="w+", dtype=dtype, shape=shape)
+    with open(Path(dst).with_suffix(".json"), "w") as f:
+        json.dump(attrs, f, indent=1)
+    return array, array.flush
+
+def _open_hdf5(dst, shape, dtype, attrs, chunks):
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Converting to HDF5 requires h5py. ")
+    f = h5py.File(dst, "w")
+    dset = f.create_dataset("data", shape=shape, dtype=dtype, chunks=chunks, compression="gzip")
+    for key, value in attrs.items():
+        dset.attrs[key] = value
+    return dset, f.close
+
+def _open_zarr(dst, shape, dtype, attrs, chunks):
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("Converting to Zarr requires zarr. ")
+    array = zarr.open_array(dst, mode="w", shape=shape, dtype=dtype, chunks=chunks)
+    array.attrs.update(attrs)
+    return array, lambda: None
+
+_openers = {"npy": _open_npy, "hdf5": _open_hdf5, "zarr": _open_zarr}
+
+def convert_ovf(fname, dst, format="npy", chunk_bytes=2**26):
+    """Convert an .ovf file to a `.npy`, HDF5 or Zarr array, without loading it all at once.
+
+    The data block is streamed in pieces of roughly **chunk_bytes**, so memory use
+    does not grow with the size of the file.
+    Rectangular meshes are stored with shape `(xnodes, ynodes, znodes, valuedim)`;
+    irregular meshes with shape `(pointcount, 3 + valuedim)`, the first three
+    columns being x, y and z.
+    The header is kept alongside: as a `.json` file next to a `.npy` file, and as
+    attributes of the HDF5 dataset `'data'` or of the Zarr array.
+
+    **Parameters**
+
+    * **fname** : _str or Path_ <br />
+    The .ovf file to convert.
+
+    * **dst** : _str or Path_ <br />
+    The file to write. Will be overwritten if it exists already.
+
+    * **format** : _str, optional_ <br />
+    One of "npy", "hdf5" and "zarr". HDF5 requires `h5py` and Zarr requires `zarr`. <br />
+    Default is `format = "npy"`.
+
+    * **chunk_bytes** : _int, optional_ <br />
+    Approximate number of bytes decoded at once. Rectangular meshes are always
+    read at least one z-plane at a time. The HDF5 and Zarr arrays are chunked
+    so that each piece covers whole chunks, which are at most 4 MiB. <br />
+    Default is `chunk_bytes = 2**26`.
+
+    **Returns**
+
+    * **metadata** : _dict_ <br />
+    The header of the converted file.
+    """
+    if format not in _openers:
+        raise ValueError("Format must be either 'npy', 'hdf5', or 'zarr'.")
+    with open(fname, "rb") as f:
+        header = ut._read_header(f)
+        nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+        header['repr'] = "text" if nbytes is None else f"Binary {nbytes}"
+        shape = _output_shape(header)
+        dtype = ut._data_dtype(nbytes, ut._byteorder(header))
+        # Before the header is copied to the attributes, as the values are multiplied
+        multiplier = ut._take_multiplier(header)
+        # Write whole chunks of the output at a time
+        chunks, slices = _storage_chunks(shape, np.dtype(dtype).itemsize,
+                                         ut._slices_per_chunk(header, nbytes, chunk_bytes))
+        array, close = _openers[format](dst, shape, dtype, _attributes(header), chunks)
+        try:
+            for start, block in ut._iter_data_chunks(f, header, nbytes, slices_per_chunk=slices,
+                                                      multiplier=multiplier):
+                index = (slice(None),) * (len(shape) - 2)
+                index += (slice(start, start + block.shape[-1]), slice(None))
+                array[index] = np.moveaxis(block, 0, -1)
+        finally:
+            close()
+    return header
+
+def _component_stats(fname, chunk_bytes=2**26):
+    """Streaming count, min, max, mean and standard deviation of each data component."""
+    with open(fname, "rb") as f:
+        header = ut._read_header(f)
+        nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+        shape, keys = ut._data_shape(header)
+        offset = 3 if header['meshtype'] == 'irregular' else 0
+        labels = keys[offset:]
+        count = 0
+        total = np.zeros(len(labels))
+        total_sq = np.zeros(len(labels))
+        vmin = np.full(len(labels), np.inf)
+        vmax = np.full(len(labels), -np.inf)
+        for start, block in ut._iter_data_chunks(f, header, nbytes, chunk_bytes):
+            values = block[offset:].reshape((len(labels), -1)).astype(float)
+            count += values.shape[1]
+            total += values.sum(axis=1)
+            total_sq += (values**2).sum(axis=1)
+            vmin = np.minimum(vmin, values.min(axis=1))
+            vmax = np.maximum(vmax, values.max(axis=1))
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - mean**2, 0.))
+    return {label: {"count": count, "min": vmin[i], "max": vmax[i],
+                    "mean": mean[i], "std": std[i]}
+            for i, label in enumerate(labels)}
@@ -0,0 +1,149 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import time
+import tracemalloc
+
+# Registered observers. Phases are only timed while this list is non-empty.
+_observers = []
+
+class _NullPhase:
+    """Stand-in returned by `_phase()` when no observers are registered."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def nbytes(self):
+        return None
+
+    @nbytes.setter
+    def nbytes(self, value):
+        pass
+
+_NULL_PHASE = _NullPhase()
+
+class _Phase:
+    """Times one phase and reports it to the registered observers."""
+    __slots__ = ("name", "nbytes", "_f", "_pos0", "_t0", "_mem0")
+
+    def __init__(self, name, f=None, nbytes=None):
+        self.name = name
+        self.nbytes = nbytes
+        self._f = f
+
+    def __enter__(self):
+        self._pos0 = self._f.tell() if self._f is not None else None
+        self._mem0 = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._t0
+        if self.nbytes is None and self._pos0 is not None:
+            self.nbytes = self._f.tell() - self._pos0
+        allocated = None
+        if self._mem0 is not None and tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - self._mem0
+        event = {"phase": self.name, "seconds": seconds,
+                 "nbytes": self.nbytes, "allocated": allocated}
+        for observer in tuple(_observers):
+            observer(event)
+        return False
+
+def _phase(name, f=None, nbytes=None):
+    """Context manager timing the phase `name`.
+
+    If `f` is given, the bytes moved are taken from the change in `f.tell()`;
+    otherwise the caller can set `nbytes` on the returned object.
+    """
+    if not _observers:
+        return _NULL_PHASE
+    return _Phase(name, f, nbytes)
+
+def add_observer(observer):
+    """Register a callback that is called once for each completed read/write phase.
+
+    The callback receives a dict with the keys `'phase'`, `'seconds'`, `'nbytes'`
+    and `'allocated'`. Phase names are `'header'`, `'seek'`, `'decode'` and `'coords'`
+    for reading, and `'render_header'` and `'encode'` for writing.
+    `'nbytes'` is `None` when the phase does not move bytes to or from a file.
+    `'allocated'` is the change in memory traced by `tracemalloc`, and is `None`
+    unless `tracemalloc` has been started by the caller.
+
+    Nothing is timed while no observer is registered.
+
+    **Parameters**
+
+    * **observer** : _callable_ <br />
+    Function taking a single event dict.
+    """
+    _observers.append(observer)
+
+def remove_observer(observer):
+    """Unregister a callback previously registered with `add_observer()`.
+
+    **Parameters**
+
+    * **observer** : _callable_ <br />
+    The function to remove.
+    """
+    _observers.remove(observer)
+
+class PhaseCounters:
+    """Observer that accumulates per-phase counters across calls.
+
+    Can be used as a context manager, in which case it is registered on entry and
+    unregistered on exit:
+
+    ```python
+    with ovf2io.PhaseCounters() as counters:
+        ovf2io.read_ovf("file.ovf")
+    print(counters.as_dict()['decode']['seconds'])
+    ```
+
+    `as_dict()` returns, for each phase, the number of `'calls'` and the total
+    `'seconds'`, `'nbytes'` and `'allocated'`.
+    """
+    def __init__(self):
+        self.counters = {}
+
+    def __call__(self, event):
+        counter = self.counters.setdefault(event["phase"],
+                {"calls": 0, "seconds": 0., "nbytes": 0, "allocated": 0})
+        counter["calls"] += 1
+        counter["seconds"] += event["seconds"]
+        counter["nbytes"] += event["nbytes"] or 0
+        counter["allocated"] += event["allocated"] or 0
+
+    def __enter__(self):
+        add_observer(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_observer(self)
+        return False
+
+    def reset(self):
+        """Clear all accumulated counters."""
+        self.counters = {}
+
+    def as_dict(self):
+        """Return a copy of the accumulated counters, keyed by phase name."""
+        return {phase: dict(counter) for phase, counter in self.counters.items()}
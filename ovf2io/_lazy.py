@@ -0,0 +1,222 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import math
+from collections.abc import Mapping
+from pathlib import Path
+import numpy as np
+from . import _utils as ut
+from ._instrument import _phase
+
+class _LazyMapping(Mapping):
+    """Read-only mapping whose values are produced by `get(key)` when looked up."""
+    __slots__ = ("_keys", "_get")
+
+    def __init__(self, keys, get):
+        self._keys = tuple(keys)
+        self._get = get
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._get(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"<lazy mapping of {list(self._keys)}>"
+
+class OVFFile:
+    """An .ovf file whose header has been read, but whose data is read on demand.
+
+    Created by `open_ovf()`. Each data component, coordinate axis and vector stack
+    is decoded the first time it is accessed, and cached. For binary files only
+    the requested component is decoded; text files are parsed once, in full, on
+    first access.
+
+    ```python
+    f = ovf2io.open_ovf("m000123.ovf")
+    print(f.metadata['title'])
+    m_z = f['m_z']                 # or f.data['m_z']
+    m = f.vector()                 # shape (xnodes, ynodes, znodes, valuedim)
+    x = f.coords['x']
+    ```
+
+    `f.data` and `f.coords` are mappings like `read_ovf(fname)['data']` and
+    `read_ovf(fname)['coords']`, and `f.to_dict()` gives the full `read_ovf()`
+    dictionary. The coordinates of rectangular meshes are read-only broadcast
+    views, so they take no memory.
+    """
+    __slots__ = ("fname", "metadata", "order", "native", "dtype",
+                 "_nbytes", "_data_offset", "_shape", "_keys", "_multiplier", "_cache")
+
+    def __init__(self, fname, order="xyz", native=False, dtype=None):
+        self.fname = Path(fname)
+        self.order = order
+        self.native = native
+        self.dtype = dtype
+        self._cache = {}
+        with open(self.fname, "rb") as f:
+            with _phase("header", f):
+                header = ut._read_header(f)
+            with _phase("seek", f):
+                self._nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+            self._data_offset = f.tell()
+        header['repr'] = "text" if self._nbytes is None else f"Binary {self._nbytes}"
+        # The data is multiplied as it is decoded, so the metadata shows it as applied
+        self._multiplier = ut._take_multiplier(header)
+        self.metadata = header
+        self._shape, self._keys = ut._data_shape(header)
+
+    def __repr__(self):
+        return f"OVFFile('{self.fname}', {self.metadata['meshtype']}, {self.metadata['repr']})"
+
+    @property
+    def labels(self):
+        """Labels of the data components."""
+        return list(self._keys[3:] if self.metadata['meshtype'] == 'irregular' else self._keys)
+
+    @property
+    def data(self):
+        """Mapping from each label to its data component, decoded on access."""
+        return _LazyMapping(self.labels, self.component)
+
+    @property
+    def coords(self):
+        """Mapping from 'x', 'y' and 'z' to the coordinates, generated on access."""
+        return _LazyMapping("xyz", self.coord)
+
+    def __getitem__(self, label):
+        return self.component(label)
+
+    def __contains__(self, label):
+        return label in self.labels
+
+    def component(self, label):
+        """The data component `label`, as `read_ovf(fname)['data'][label]`."""
+        if label not in self.labels:
+            raise KeyError(label)
+        return self._oriented(self._entry(label))
+
+    def coord(self, axis):
+        """The coordinates along `axis` ('x', 'y' or 'z'), as `read_ovf(fname)['coords'][axis]`."""
+        if axis not in ("x", "y", "z"):
+            raise KeyError(axis)
+        if self.metadata['meshtype'] == 'irregular':
+            return self._entry(axis)
+        key = ("coord", axis)
+        if key not in self._cache:
+            header = self.metadata
+            values = header[axis + 'min'] + header[axis + 'stepsize'] * (1/2 + np.arange(header[axis + 'nodes']))
+            shape = [1, 1, 1]
+            shape[self.order.index(axis)] = values.size
+            grid = tuple(header[a + 'nodes'] for a in self.order)
+            self._cache[key] = np.broadcast_to(values.reshape(shape), grid)
+        return self._cache[key]
+
+    def vector(self, labels=None):
+        """The components `labels` (default: all of them) stacked along a new last axis."""
+        labels = tuple(self.labels if labels is None else labels)
+        key = ("vector", labels)
+        if key not in self._cache:
+            self._cache[key] = np.stack([self.component(label) for label in labels], axis=-1)
+        return self._cache[key]
+
+    def to_dict(self):
+        """Decode everything, and return the dictionary `read_ovf()` would."""
+        return {'data': dict(self.data), 'coords': dict(self.coords), 'metadata': self.metadata}
+
+    def _oriented(self, array):
+        if self.metadata['meshtype'] == 'rectangular' and self.order != "xyz":
+            return array.transpose(ut._axes_permutation(self.order))
+        return array
+
+    def _entry(self, key):
+        """Entry `key` of the data block (a label, or 'x', 'y', 'z' for irregular meshes), cached."""
+        if key not in self._cache:
+            if self._nbytes is None:
+                self._decode_text()
+            else:
+                self._decode_binary(key)
+        return self._cache[key]
+
+    def _decode_text(self):
+        with open(self.fname, "rb") as f:
+            f.seek(self._data_offset)
+            with _phase("decode", f):
+                header = dict(self.metadata, valuemultiplier=self._multiplier)
+                data = ut._parse_data(f, header, None, dtype=self.dtype)
+        self._cache.update(data)
+
+    def _decode_binary(self, key):
+        index = self._keys.index(key)
+        count = math.prod(self._shape)
+        file_dtype = np.dtype(ut._data_dtype(self._nbytes, ut._byteorder(self.metadata)))
+        out_dtype = ut._output_dtype(file_dtype, self.native, self.dtype)
+        with _phase("decode", nbytes=count // self._shape[0] * self._nbytes):
+            if count:
+                block = np.memmap(self.fname, dtype=file_dtype, mode="r",
+                                  offset=self._data_offset, shape=(count,))
+                # Components are interleaved: entry `index` of every point
+                values = np.array(block[index::self._shape[0]], dtype=out_dtype)
+                del block
+            else:
+                values = np.zeros(0, dtype=out_dtype)
+            values = values.reshape(self._shape[1:], order='F')
+            if self._multiplier != 1. and (self.metadata['meshtype'] == 'rectangular' or index >= 3):
+                values *= self._multiplier
+        self._cache[key] = values
+
+def open_ovf(fname, order="xyz", native=False, dtype=None):
+    """Open an .ovf file, reading only its header until the data is needed.
+
+    Returns an `OVFFile`, whose `metadata` is available at once and whose data
+    components and coordinates are each decoded on first access, then cached.
+    This avoids most of the work of `read_ovf()` when only the header or a
+    few components are needed.
+
+    ```python
+    f = ovf2io.open_ovf("m000123.ovf")
+    if f.metadata['title'] == "m":
+        m_z = f['m_z']
+    ```
+
+    **Parameters**
+
+    * **fname** : _str or Path_ <br />
+    The filename.
+
+    * **order** : _str, optional_ <br />
+    Order of the axes of rectangular-mesh arrays, as for `read_ovf()`. <br />
+    Default is `order = "xyz"`.
+
+    * **native** : _bool, optional_ <br />
+    If `True`, big-endian (OVF 1.0) binary data is converted to the native byte order. <br />
+    Default is `native = False`.
+
+    * **dtype** : _data-type, optional_ <br />
+    Convert the data to this type while reading. `None` keeps the type of the file. <br />
+    Default is `dtype = None`.
+
+    **Returns**
+
+    * **file** : _OVFFile_ <br />
+    The opened file.
+    """
+    return OVFFile(fname, order, native, dtype)
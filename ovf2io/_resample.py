@@ -0,0 +1,124 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Resampling of rectangular meshes while reading, one slab of z-planes at a time.
+
+The resampling is separable: along each axis, every target cell is a weighted sum
+of a few source cells, given by an `(index, weight)` pair of arrays with shape
+`(n_target, K)`. x and y are applied to each slab as it is read, and each slab
+then adds its share to the target z-planes it contributes to.
+"""
+import numpy as np
+from . import _utils as ut
+from ._instrument import _phase
+
+_methods = ("nearest", "linear", "block_mean")
+
+def _axis_weights(n, h, n_new, h_new, method):
+    """Source cells and weights of each target cell along one axis, both of shape `(n_new, K)`.
+
+    Positions are measured from the lower edge of the mesh, where source cell `j`
+    spans `[j*h, (j+1)*h]` and target cell `i` spans `[i*h_new, (i+1)*h_new]`.
+    """
+    centers = h_new * (0.5 + np.arange(n_new))
+    if method == "nearest":
+        index = np.clip(np.floor(centers / h).astype(np.intp), 0, n - 1)[:, np.newaxis]
+        weight = np.ones(index.shape)
+    elif method == "linear":
+        # Fractional index among the source cell centers, constant beyond the outer centers
+        u = np.clip(centers / h - 0.5, 0, n - 1)
+        lo = np.minimum(np.floor(u).astype(np.intp), max(n - 2, 0))
+        w = u - lo
+        index = np.stack((lo, np.minimum(lo + 1, n - 1)), axis=1)
+        weight = np.stack((1 - w, w), axis=1)
+    else:
+        lower = h_new * np.arange(n_new)
+        upper = lower + h_new
+        first = np.clip(np.floor(lower / h).astype(np.intp), 0, n - 1)
+        last = np.clip(np.ceil(upper / h).astype(np.intp) - 1, first, n - 1)
+        index = first[:, np.newaxis] + np.arange((last - first).max() + 1)
+        valid = index <= last[:, np.newaxis]
+        index = np.minimum(index, n - 1)
+        overlap = (np.minimum(upper[:, np.newaxis], (index + 1) * h)
+                   - np.maximum(lower[:, np.newaxis], index * h))
+        overlap = np.where(valid, np.maximum(overlap, 0.), 0.)
+        weight = overlap / overlap.sum(axis=1, keepdims=True)
+    return index, weight
+
+def _apply_axis(array, index, weight, axis):
+    """Resample `array` along `axis` with the weights of `_axis_weights()`."""
+    shape = [1] * array.ndim
+    shape[axis] = len(index)
+    out = 0.
+    for k in range(index.shape[1]):
+        out = out + weight[:, k].reshape(shape) * np.take(array, index[:, k], axis=axis)
+    return out
+
+def _target_grid(header, resample):
+    """Number of nodes and cellsize of the target grid, along x, y and z.
+
+    The target covers the same region as the file, so a requested `cellsize` is
+    adjusted to fit a whole number of cells.
+    """
+    nodes = np.array([header[a + 'nodes'] for a in "xyz"])
+    stepsize = np.array([header[a + 'stepsize'] for a in "xyz"])
+    extent = nodes * stepsize
+    if resample.get("shape") is not None:
+        new_nodes = np.array(resample["shape"], dtype=np.intp)
+    elif resample.get("cellsize") is not None:
+        cellsize = np.broadcast_to(np.asarray(resample["cellsize"], dtype=float), (3,))
+        new_nodes = np.maximum(1, np.round(extent / cellsize)).astype(np.intp)
+    else:
+        raise ValueError("resample requires either 'cellsize' or 'shape'. ")
+    if new_nodes.shape != (3,) or np.any(new_nodes < 1):
+        raise ValueError("The resampled shape must have three positive entries. ")
+    return new_nodes, extent / new_nodes
+
+def _read_resampled(f, resample, order="xyz", dtype=None):
+    """Read the segment starting at the current position of `f` onto a new grid. See `read_ovf()`."""
+    resample = dict(resample)
+    method = resample.get("method", "linear")
+    if method not in _methods:
+        raise ValueError("Method must be either 'nearest', 'linear', or 'block_mean'.")
+    with _phase("header", f):
+        header = ut._read_header(f)
+    if header['meshtype'] != 'rectangular':
+        raise ValueError("Resampling requires a rectangular mesh. ")
+    with _phase("seek", f):
+        nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+    new_nodes, new_stepsize = _target_grid(header, resample)
+    weights = [_axis_weights(header[a + 'nodes'], header[a + 'stepsize'],
+                             new_nodes[i], new_stepsize[i], method)
+               for i, a in enumerate("xyz")]
+    file_dtype = np.dtype(ut._data_dtype(nbytes, ut._byteorder(header)))
+    out_dtype = ut._output_dtype(file_dtype, True, dtype)
+    out = np.zeros((header['valuedim'],) + tuple(new_nodes), dtype=out_dtype)
+    z_index, z_weight = weights[2]
+    with _phase("decode", f):
+        for start, slab in ut._iter_data_chunks(f, header, nbytes, resample.get("chunk_bytes", 2**26)):
+            slab = _apply_axis(slab, *weights[0], axis=1)
+            slab = _apply_axis(slab, *weights[1], axis=2)
+            # Add this slab's share to each target z-plane
+            for k in range(z_index.shape[1]):
+                source = z_index[:, k] - start
+                targets = np.nonzero((source >= 0) & (source < slab.shape[-1])
+                                     & (z_weight[:, k] != 0))[0]
+                out[..., targets] += z_weight[targets, k] * slab[..., source[targets]]
+    for i, a in enumerate("xyz"):
+        header[a + 'nodes'] = int(new_nodes[i])
+        header[a + 'stepsize'] = float(new_stepsize[i])
+        header[a + 'base'] = header[a + 'min'] + 0.5 * header[a + 'stepsize']
+    data = {key: out[i] for i, key in enumerate(header['valuelabels'])}
+    return ut._segment_dict(header, nbytes, data, order)
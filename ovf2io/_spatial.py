@@ -0,0 +1,311 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import itertools
+import os
+from pathlib import Path
+import numpy as np
+from . import _utils as ut
+
+def _index_fname(fname):
+    return Path(str(fname) + ".idx.npz")
+
+def _check_finite(array, name):
+    """Raise if `array` contains NaN or infinity, which have no cell in the index."""
+    if not np.all(np.isfinite(array)):
+        raise ValueError(f"{name} must be finite. ")
+
+class IrregularMesh:
+    """Points of an irregular mesh, with a spatial index for fast queries.
+
+    The points are binned once into a uniform grid of cells holding about
+    **points_per_cell** points each, so that box, radius and nearest-neighbour
+    queries only look at the points in nearby cells instead of at every point.
+    This works best when the points are spread fairly evenly over their bounding box,
+    as for the mesh of a simulation.
+
+    ```python
+    mesh = ovf2io.IrregularMesh.from_file("probes.ovf", persist=True)
+    distances, indices = mesh.nearest([[0., 0., 0.], [1e-9, 0., 0.]])
+    values = mesh.data['m_x'][indices]
+    ```
+
+    **Parameters**
+
+    * **points** : _ndarray_ <br />
+    Coordinates of the points, with shape `(N_points, 3)`.
+
+    * **data** : _dict, optional_ <br />
+    Values at the points, e.g. `read_ovf(fname)['data']`. Each entry should have length `N_points`.
+
+    * **metadata** : _dict, optional_ <br />
+    Header of the file the points were read from.
+
+    * **points_per_cell** : _float, optional_ <br />
+    Average number of points per cell of the index. <br />
+    Default is `points_per_cell = 2.`.
+    """
+    def __init__(self, points, data=None, metadata=None, points_per_cell=2., _index=None):
+        self.points = np.ascontiguousarray(points, dtype=float)
+        if self.points.ndim != 2 or self.points.shape[1] != 3:
+            raise ValueError("Points should have shape (N_points, 3). ")
+        self.data = data if data is not None else {}
+        self.metadata = metadata if metadata is not None else {}
+        if _index is None:
+            _index = self._build_index(points_per_cell)
+        self._lo, self._h, self._n, self._order, self._starts = _index
+
+    @classmethod
+    def from_file(cls, fname, persist=False, points_per_cell=2.):
+        """Read an irregular-mesh .ovf file and index its points.
+
+        **Parameters**
+
+        * **fname** : _str or Path_ <br />
+        The filename.
+
+        * **persist** : _bool, optional_ <br />
+        If `True`, the index is saved next to the file as `fname + ".idx.npz"`, and
+        loaded from there the next time, as long as the .ovf file is unchanged. <br />
+        Default is `persist = False`.
+
+        * **points_per_cell** : _float, optional_ <br />
+        Average number of points per cell of the index, if it is built. <br />
+        Default is `points_per_cell = 2.`.
+        """
+        from . import read_ovf
+        file_dict = read_ovf(fname)
+        if file_dict['metadata']['meshtype'] != 'irregular':
+            raise ValueError("IrregularMesh requires a file with an irregular mesh. ")
+        coords = file_dict['coords']
+        points = np.stack((coords['x'], coords['y'], coords['z']), axis=-1)
+        index = None
+        stat = os.stat(fname)
+        source = np.array([stat.st_size, stat.st_mtime_ns])
+        if persist and _index_fname(fname).exists():
+            with np.load(_index_fname(fname)) as saved:
+                if np.array_equal(saved['source'], source):
+                    index = tuple(saved[key] for key in ("lo", "h", "n", "order", "starts"))
+        mesh = cls(points, file_dict['data'], file_dict['metadata'], points_per_cell, index)
+        if persist and index is None:
+            mesh.save_index(_index_fname(fname), source)
+        return mesh
+
+    def save_index(self, fname, source=()):
+        """Save the spatial index to `fname` (an `.npz` file)."""
+        np.savez(fname, lo=self._lo, h=self._h, n=self._n, order=self._order,
+                 starts=self._starts, source=np.asarray(source))
+
+    def _build_index(self, points_per_cell):
+        points = self.points
+        lo = points.min(axis=0) if len(points) else np.zeros(3)
+        extent = (points.max(axis=0) if len(points) else np.zeros(3)) - lo
+        active = extent > 0
+        n = np.ones(3, dtype=np.intp)
+        if active.any():
+            volume = np.prod(extent[active])
+            side = (volume * points_per_cell / len(points)) ** (1 / active.sum())
+            n[active] = np.maximum(1, np.ceil(extent[active] / side)).astype(np.intp)
+        h = np.where(active, extent / n, 1.)
+        linear = np.ravel_multi_index(tuple(self._cells(points, lo, h, n).T), tuple(n))
+        order = np.argsort(linear, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(np.bincount(linear, minlength=np.prod(n)))))
+        return lo, h, n, order, starts
+
+    @staticmethod
+    def _cells(points, lo, h, n):
+        return np.clip(np.floor((points - lo) / h).astype(np.intp), 0, n - 1)
+
+    def _gather(self, cells):
+        """Indices of the points in each of the linear `cells`, and how many there are per cell."""
+        begin = self._starts[cells]
+        count = self._starts[cells + 1] - begin
+        offsets = np.cumsum(count) - count
+        positions = np.repeat(begin - offsets, count) + np.arange(count.sum())
+        return self._order[positions], count
+
+    def _query_boxes(self, pmin, pmax, centers=None, radius=None):
+        """Indices of the points in each of the boxes `pmin[n] <= point <= pmax[n]`, 
+        and within `radius` of `centers[n]` if given, as a list of sorted arrays.
+
+        All boxes are processed together: the cells of every box are enumerated at once,
+        their points gathered with a single call to `_gather()`, and filtered with one mask.
+        """
+        first = self._cells(pmin, self._lo, self._h, self._n)
+        last = np.maximum(self._cells(pmax, self._lo, self._h, self._n), first)
+        extent = last - first + 1
+        ncells = np.prod(extent, axis=1)
+        box = np.repeat(np.arange(len(pmin)), ncells)
+        # Position of each cell within its box, unravelled along the extent of that box
+        local = np.arange(ncells.sum()) - np.repeat(np.cumsum(ncells) - ncells, ncells)
+        e = extent[box]
+        offsets = np.stack((local // (e[:, 1] * e[:, 2]), (local // e[:, 2]) % e[:, 1], local % e[:, 2]), axis=-1)
+        linear = np.ravel_multi_index(tuple((first[box] + offsets).T), tuple(self._n))
+        candidates, count = self._gather(linear)
+        qid = np.repeat(box, count)
+        p = self.points[candidates]
+        keep = np.all((p >= pmin[qid]) & (p <= pmax[qid]), axis=1)
+        if centers is not None:
+            keep &= np.sum((p - centers[qid])**2, axis=1) <= radius[qid]**2
+        candidates, qid = candidates[keep], qid[keep]
+        order = np.lexsort((candidates, qid))
+        counts = np.bincount(qid, minlength=len(pmin))
+        return np.split(candidates[order], np.cumsum(counts)[:-1])
+
+    def query_box(self, pmin, pmax):
+        """Indices of the points with `pmin <= point <= pmax` in each coordinate.
+
+        Returns one sorted array of indices for a single box, with `pmin` and `pmax` 
+        of shape `(3,)`, and a list of arrays for boxes of shape `(N, 3)`.
+        """
+        pmin = np.asarray(pmin, dtype=float)
+        pmax = np.asarray(pmax, dtype=float)
+        _check_finite(pmin, "pmin")
+        _check_finite(pmax, "pmax")
+        single = pmin.ndim == 1 and pmax.ndim == 1
+        pmin, pmax = np.broadcast_arrays(np.atleast_2d(pmin), np.atleast_2d(pmax))
+        out = self._query_boxes(pmin, pmax)
+        return out[0] if single else out
+
+    def query_radius(self, centers, radius):
+        """Indices of the points within `radius` of each of the `centers`.
+
+        Returns one sorted array of indices for a single center of shape `(3,)`,
+        and a list of arrays for centers of shape `(N, 3)`. **radius** can be a 
+        single value, or one value per center.
+        """
+        centers = np.asarray(centers, dtype=float)
+        q = np.atleast_2d(centers)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(q),))
+        _check_finite(q, "Centers")
+        _check_finite(radius, "Radius")
+        out = self._query_boxes(q - radius[:, np.newaxis], q + radius[:, np.newaxis], q, radius)
+        return out[0] if centers.ndim == 1 else out
+
+    def _shell(self, s):
+        """Cell offsets at Chebyshev distance exactly `s`, along the axes that have more than one cell."""
+        ranges = [range(-s, s + 1) if n > 1 else range(1) for n in self._n]
+        offsets = np.array(list(itertools.product(*ranges)), dtype=np.intp).reshape((-1, 3))
+        return offsets[np.abs(offsets).max(axis=1) == s]
+
+    def _unsearched_distance(self, q, cell, s):
+        """Lower bound on the distance from each query to the points outside its first `s` shells."""
+        # Distance to the bounding box of the points, along each axis
+        hi = self._lo + np.where(self._n > 1, self._h * self._n, 0.)
+        outside = np.maximum(np.maximum(self._lo - q, q - hi), 0.)
+        bound = np.full(len(q), np.inf)
+        for a in range(3):
+            below = self._lo[a] + (cell[:, a] - s) * self._h[a]
+            above = self._lo[a] + (cell[:, a] + s + 1) * self._h[a]
+            gap = np.minimum(np.where(cell[:, a] - s > 0, q[:, a] - below, np.inf),
+                             np.where(cell[:, a] + s < self._n[a] - 1, above - q[:, a], np.inf))
+            others = np.sum(np.delete(outside, a, axis=1)**2, axis=1)
+            bound = np.minimum(bound, np.sqrt(np.maximum(gap, 0.)**2 + others))
+        return bound
+
+    def nearest(self, queries):
+        """Distance to, and index of, the point nearest to each of the `queries`.
+
+        The search starts in the cell of each query and moves outwards one shell
+        of cells at a time, until no unsearched point can be closer. All queries
+        are processed together at each step.
+
+        **Parameters**
+
+        * **queries** : _ndarray_ <br />
+        Coordinates with shape `(N_queries, 3)`, or `(3,)` for a single query.
+
+        **Returns**
+
+        * **distances** : _ndarray_ <br />
+        Distance to the nearest point, for each query.
+
+        * **indices** : _ndarray_ <br />
+        Index of the nearest point, for each query.
+        """
+        if len(self.points) == 0:
+            raise ValueError("Cannot query an empty mesh. ")
+        queries = np.asarray(queries, dtype=float)
+        q = np.atleast_2d(queries)
+        _check_finite(q, "Queries")
+        best_d = np.full(len(q), np.inf)
+        best_i = np.full(len(q), -1, dtype=np.intp)
+        cell = self._cells(q, self._lo, self._h, self._n)
+        pending = np.arange(len(q))
+        s = 0
+        while pending.size:
+            cells = cell[pending][:, np.newaxis, :] + self._shell(s)[np.newaxis]
+            valid = np.all((cells >= 0) & (cells < self._n), axis=-1)
+            qid = np.broadcast_to(pending[:, np.newaxis], valid.shape)[valid]
+            linear = np.ravel_multi_index(tuple(cells[valid].T), tuple(self._n))
+            candidates, count = self._gather(linear)
+            qid = np.repeat(qid, count)
+            d = np.linalg.norm(self.points[candidates] - q[qid], axis=1)
+            # Closest candidate of each query: the first of its run after sorting by (query, distance)
+            order = np.lexsort((d, qid))
+            first = order[np.diff(qid[order], prepend=-1) != 0]
+            better = d[first] < best_d[qid[first]]
+            best_d[qid[first][better]] = d[first][better]
+            best_i[qid[first][better]] = candidates[first][better]
+            done = best_d[pending] <= self._unsearched_distance(q[pending], cell[pending], s)
+            pending = pending[~done]
+            s += 1
+        if queries.ndim == 1:
+            return best_d[0], best_i[0]
+        return best_d, best_i
+
+    def to_rectangular(self, p0, cellsize, shape, max_distance=None, fill_value=np.nan):
+        """Nearest-neighbour interpolation of the data onto a rectangular grid.
+
+        **Parameters**
+
+        * **p0** : _tuple_ <br />
+        The coordinates of the first grid point.
+
+        * **cellsize** : _tuple_ <br />
+        The distance between adjacent grid points.
+
+        * **shape** : _tuple_ <br />
+        The number of grid points `(N_x, N_y, N_z)`.
+
+        * **max_distance** : _float, optional_ <br />
+        Grid points farther than this from every mesh point are set to **fill_value**.
+
+        * **fill_value** : _float, optional_ <br />
+        Default is `fill_value = np.nan`.
+
+        **Returns**
+
+        * **file_dict** : _dict_ <br />
+        A dictionary with `'data'` and `'coords'` entries of shape `(N_x, N_y, N_z)`,
+        like that of `read_ovf()` for a rectangular mesh.
+        """
+        grid = {"meshtype": "rectangular",
+                "xnodes": shape[0], "ynodes": shape[1], "znodes": shape[2],
+                "xstepsize": cellsize[0], "ystepsize": cellsize[1], "zstepsize": cellsize[2],
+                "xmin": p0[0] - 0.5 * cellsize[0], "ymin": p0[1] - 0.5 * cellsize[1],
+                "zmin": p0[2] - 0.5 * cellsize[2]}
+        coords = ut._gen_coords({}, grid)
+        data = {key: np.full(tuple(shape), fill_value, dtype=float) for key in self.data}
+        # One z-plane at a time, to bound the memory used by the queries
+        for k in range(shape[2]):
+            plane = np.stack([coords[axis][:, :, k].ravel() for axis in "xyz"], axis=-1)
+            d, i = self.nearest(plane)
+            for key, values in self.data.items():
+                plane_values = np.asarray(values, dtype=float)[i]
+                if max_distance is not None:
+                    plane_values[d > max_distance] = fill_value
+                data[key][:, :, k] = plane_values.reshape(tuple(shape[:2]))
+        return {'data': data, 'coords': coords}
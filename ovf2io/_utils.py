@@ -14,11 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import math
+import os
+import re
 import struct
 import shlex
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from . import _templates
+from ._instrument import _phase
 
 def _create_header_entry(key, value, header):
     """Create a new header entry. 
@@ -31,71 +35,93 @@ def _create_header_entry(key, value, header):
         return {"desc": desc}
     return {key: value}
 
-def _check_header_keys(header):
+# Keys that only appear in OVF 1.0 files
+_ovf1_keys = frozenset({"valueunit", "valuemultiplier", "valuerangeminmag", "valuerangemaxmag", "boundary"})
+_mandatory_keys = frozenset({"title", "meshunit", "valueunits", "valuedim", "valuelabels", 
+                             "xmin", "xmax", "ymin", "ymax", "zmin", "zmax",
+                             "meshtype"})
+_mandatory_rectangular_keys = frozenset({"xbase", "ybase", "zbase", 
+                                         "xstepsize", "ystepsize", "zstepsize",
+                                         "xnodes", "ynodes", "znodes"})
+_mandatory_irregular_keys = frozenset({"pointcount"})
+_known_keys = _mandatory_keys | _mandatory_rectangular_keys | _mandatory_irregular_keys | {"desc"}
+
+def _check_header_keys(header, version="2.0"):
     """Check for missing or extra header keys.
 
     Warns if extra, raises Exception if missing. 
     """
-    mandatory_keys = {"title", "meshunit", "valueunits", "valuedim", "valuelabels", 
-                     "xmin", "xmax", "ymin", "ymax", "zmin", "zmax",
-                     "meshtype"}
-    mandatory_rectangular_keys = {"xbase", "ybase", "zbase", 
-                                  "xstepsize", "ystepsize", "zstepsize",
-                                  "xnodes", "ynodes", "znodes"}
-    mandatory_irregular_keys = {"pointcount"}
-    missing_keys = mandatory_keys - set(header.keys())
+    keys = header.keys()
     # Checking for missing keys
-    if missing_keys != set():
-        for key in missing_keys:
-            raise Exception("Key '{}' is required, but was not found in the header. ".format(key))
+    for key in _mandatory_keys - keys:
+        raise Exception("Key '{}' is required, but was not found in the header. ".format(key))
     if header['meshtype'] == "rectangular":
-        missing_rectangular_keys = mandatory_rectangular_keys - set(header.keys())
-        for key in missing_rectangular_keys:
+        for key in _mandatory_rectangular_keys - keys:
             raise Exception(f"Key '{key}' is required when meshtype is rectangular, "
                             "but was not found in the header. ")
     elif header['meshtype'] == 'irregular':
-        missing_irregular_keys = mandatory_irregular_keys - set(header.keys())
-        for key in missing_irregular_keys:
+        for key in _mandatory_irregular_keys - keys:
             raise Exception(f"Key '{key}' is required when meshtype is irregular, "
                             "but was not found in the header. ")
     # Checking for extra keys
-    extra_keys = (set(header.keys()) - mandatory_keys 
-                - mandatory_irregular_keys - mandatory_rectangular_keys - {'desc'})
-    if extra_keys != set():
-        for key in extra_keys:
-            warnings.warn(f"'{key}' is not a recognized key. ")
+    extra_keys = keys - _known_keys
+    if version == "1.0":
+        extra_keys -= _ovf1_keys
+    for key in extra_keys:
+        warnings.warn(f"'{key}' is not a recognized key. ")
     return
 
+_float_keys = frozenset({'xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax',
+                         'xbase', 'ybase', 'zbase', 'xstepsize', 'ystepsize', 'zstepsize',
+                         'valuemultiplier', 'valuerangeminmag', 'valuerangemaxmag'})
+_int_keys = frozenset({'valuedim', 'pointcount', 'xnodes', 'ynodes', 'znodes'})
+
+def _split_labels(value):
+    """Split shell style, as `shlex.split()`, which is only needed if there are quotes or escapes."""
+    if '"' in value or "'" in value or "\\" in value:
+        return shlex.split(value)
+    return value.split()
+
 def _format_header(header):
     """Formats the header entries. 
 
     Deals with floats, ints, and lists. 
     """
-    floatkeys = {'xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax',
-                 'xbase', 'ybase', 'zbase', 'xstepsize', 'ystepsize', 'zstepsize'}
-    intkeys = {'valuedim', 'pointcount', 'xnodes', 'ynodes', 'znodes'}
     # transform floats to floats and ints to ints
-    for key in floatkeys.intersection(set(header.keys())):
+    for key in _float_keys & header.keys():
         header[key] = float(header[key])
-    for key in intkeys.intersection(set(header.keys())):
+    for key in _int_keys & header.keys():
         header[key] = int(header[key])
     # Split shell style - valuelabels uses "" for multi-word labels
-    header['valueunits'] = shlex.split(header['valueunits'])
-    header['valuelabels'] = shlex.split(header['valuelabels'])
+    header['valueunits'] = _split_labels(header['valueunits'])
+    header['valuelabels'] = _split_labels(header['valuelabels'])
     # Value units can be one (for all dimensions) or one for each dimension
     if len(header['valueunits']) < header['valuedim']:
         header['valueunits'] = [header['valueunits'][0] for i in range(header['valuedim'])]
     return header
 
 
-def _parse_header(f):
+def _ovf1_header(header):
+    """Fill in the OVF 2.0 keys that OVF 1.0 headers lack. 
+
+    OVF 1.0 data is always 3-dimensional, with a single `valueunit`. 
+    """
+    header.setdefault("valuedim", "3")
+    header.setdefault("valuelabels", "value_0 value_1 value_2")
+    if "valueunit" in header:
+        header.setdefault("valueunits", header["valueunit"])
+    return header
+
+def _parse_header(f, version="2.0"):
     header = {}
     for line in f:
         # '##' denotes the start of comments in each line
         line = line.decode("utf-8").partition("##")[0]
         # Return once end of header is found
         if line.lower().startswith("# end: header"):
-            _check_header_keys(header)
+            if version == "1.0":
+                header = _ovf1_header(header)
+            _check_header_keys(header, version)
             header = _format_header(header)
             return header
         # Each line is a "key : value" pair
@@ -108,7 +134,7 @@ def _parse_header(f):
             header.update(_create_header_entry(key, value, header))
     raise Exception("End of header not found. ")
 
-def _advance_to_data_block(f):
+def _advance_to_data_block(f, byteorder="<"):
     mode = ""
     nbytes = None
     for line in f:
@@ -117,11 +143,37 @@ def _advance_to_data_block(f):
             mode = line.split()[3]
             if mode.lower() == "binary":
                 nbytes = int(line.split()[4])
-                _check_first_byte(f, nbytes)
+                _check_first_byte(f, nbytes, byteorder)
             return nbytes
     raise Exception("Beginning of data block not found. ")
 
-def _parse_data(f, header, nbytes):
+def _read_header(f):
+    """Check that `f` is an OVF 1.0 or 2.0 file, then parse and return its header. 
+
+    The version is stored as `header['version']`. 
+    Leaves `f` positioned just after the end of the header.
+    """
+    first = next(f)
+    if b"2.0" in first:
+        version = "2.0"
+    elif b"1.0" in first:
+        version = "1.0"
+    else:
+        raise ValueError("This file does not appear to be OVF 1.0 or 2.0. "
+                         "ovf2io does not support older OVF formats. ")
+    # Skip ahead to the header
+    while b"# begin: header" not in next(f).lower():
+        pass
+    header = _parse_header(f, version)
+    header['version'] = version
+    return header
+
+def _byteorder(header):
+    """OVF 1.0 binary data is big-endian, OVF 2.0 binary data is little-endian."""
+    return ">" if header.get('version') == "1.0" else "<"
+
+def _data_shape(header):
+    """The Fortran-ordered shape of the data block, and the label of each entry along axis 0."""
     if header['meshtype'] == 'rectangular':
         shape = (header['valuedim'], header['xnodes'], header['ynodes'], header['znodes'])
         keys = header['valuelabels']
@@ -130,13 +182,277 @@ def _parse_data(f, header, nbytes):
         keys = ["x", "y", "z"] + header['valuelabels']
     else:
         raise Exception("Meshtype not understood. ")
+    return shape, keys
+
+def _data_dtype(nbytes, byteorder="<"):
+    return float if nbytes is None else f'{byteorder}{"d" if nbytes == 8 else "f"}'
+
+def _take_multiplier(header):
+    """Return the OVF 1.0 `valuemultiplier`, and set it to 1 in `header`.
+
+    Once the data has been multiplied, the header must not tell readers of the 
+    metadata (e.g. the attributes written by `convert_ovf()`) to multiply it again. 
+    """
+    multiplier = header.get('valuemultiplier', 1.)
+    if 'valuemultiplier' in header:
+        header['valuemultiplier'] = 1.
+    return multiplier
+
+def _scale_values(array, header, multiplier):
+    """Multiply the data values (not the coordinates) of `array` in place by `multiplier`."""
+    if multiplier != 1.:
+        offset = 3 if header['meshtype'] == 'irregular' else 0
+        array[offset:] *= multiplier
+    return array
+
+def _pread_into(f, view, offset):
+    """Fill the bytes of `view` from `offset` in `f`, without moving the file position."""
+    done = 0
+    if hasattr(os, "preadv"):
+        fd = f.fileno()
+        while done < len(view):
+            n = os.preadv(fd, [view[done:]], offset + done)
+            if n == 0:
+                break
+            done += n
+    else:
+        # No positioned reads (e.g. Windows): a handle per call keeps threads independent
+        with open(f.name, "rb", buffering=0) as g:
+            g.seek(offset)
+            while done < len(view):
+                n = g.readinto(view[done:])
+                if not n:
+                    break
+                done += n
+    if done < len(view):
+        raise Exception("Data block is shorter than the header specifies. ")
+
+def _read_binary_parallel(f, count, file_dtype, out_dtype, workers, chunk_bytes=2**24):
+    """Read `count` values of `file_dtype` from the current position of `f` using `workers` threads.
+
+    The block is split into ranges of whole values, read with positioned reads 
+    straight into one preallocated array of `out_dtype`. Ranges that need a dtype 
+    or byte order conversion are read into a scratch buffer and converted by the 
+    same thread; numpy releases the GIL for both the read and the conversion. 
+    Leaves `f` positioned just after the block, as `np.fromfile()` would.
+    """
+    file_dtype = np.dtype(file_dtype)
+    out = np.empty(count, dtype=out_dtype)
+    start = f.tell()
+    n_ranges = max(workers, math.ceil(count * file_dtype.itemsize / chunk_bytes), 1)
+    bounds = np.linspace(0, count, n_ranges + 1).astype(np.intp)
+    convert = out.dtype != file_dtype
+
+    def read_range(lo, hi):
+        buffer = np.empty(hi - lo, dtype=file_dtype) if convert else out[lo:hi]
+        _pread_into(f, memoryview(buffer.view(np.uint8)), start + lo * file_dtype.itemsize)
+        if convert:
+            out[lo:hi] = buffer
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first exception of any range
+        list(pool.map(read_range, bounds[:-1], bounds[1:]))
+    f.seek(start + count * file_dtype.itemsize)
+    return out
+
+def _output_dtype(file_dtype, native=False, dtype=None):
+    """The dtype data of `file_dtype` is returned as, given the `native` and `dtype` options."""
+    out_dtype = file_dtype if dtype is None else np.dtype(dtype)
+    if native and not out_dtype.isnative:
+        out_dtype = out_dtype.newbyteorder("=")
+    return out_dtype
+
+def _converted(array, out_dtype):
+    """`array` as `out_dtype`, byteswapping in place when only the byte order differs."""
+    if out_dtype == array.dtype.newbyteorder("S"):
+        return array.byteswap(inplace=True).view(out_dtype)
+    if out_dtype != array.dtype:
+        return array.astype(out_dtype)
+    return array
+
+def _split_components(array, header):
+    """Reshape the flat data block `array`, scale it, and split it into a dict of components."""
+    shape, keys = _data_shape(header)
+    array = array.reshape(shape, order='F')
+    array = _scale_values(array, header, _take_multiplier(header))
+    return {key: array[i] for i, key in enumerate(keys)}
+
+def _parse_data(f, header, nbytes, native=False, dtype=None, workers=None):
+    shape, keys = _data_shape(header)
     count = math.prod(shape)
     sep = " " if nbytes is None else ""
-    dtype = float if nbytes is None else f'<{"d" if nbytes == 8 else "f"}'
-    array = np.fromfile(f, count=count, sep=sep, dtype=dtype).reshape(shape, order='F')
-    out = {key: array[i] for i, key in enumerate(keys)}
+    file_dtype = np.dtype(_data_dtype(nbytes, _byteorder(header)))
+    out_dtype = _output_dtype(file_dtype, native, dtype)
+    if nbytes is not None and workers is not None and workers > 1:
+        array = _read_binary_parallel(f, count, file_dtype, out_dtype, workers)
+    else:
+        array = _converted(np.fromfile(f, count=count, sep=sep, dtype=file_dtype), out_dtype)
+    return _split_components(array, header)
+
+def _data_block_nbytes(header, nbytes):
+    """Size in bytes of a binary data block, including the check value. `None` for text."""
+    if nbytes is None:
+        return None
+    shape, keys = _data_shape(header)
+    return (math.prod(shape) + 1) * nbytes
+
+def _complete_header(fname):
+    """Return the header of `fname` if the file has been completely written, else `None`.
+
+    A file is complete once its binary data block has the size given by the header 
+    and the `# End: Segment` trailer is present. Files that cannot be parsed yet, 
+    e.g. because the header is still being written, are treated as incomplete, as 
+    are files that cannot be opened, e.g. because they were removed in the meantime. 
+    """
+    try:
+        f = open(fname, "rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            header = _read_header(f)
+            nbytes = _advance_to_data_block(f, _byteorder(header))
+        except Exception:
+            return None
+        size = os.fstat(f.fileno()).st_size
+        expected = _data_block_nbytes(header, nbytes)
+        if expected is not None and size < f.tell() - nbytes + expected:
+            return None
+        f.seek(max(0, size - 64))
+        # Prefix only: some writers (e.g. discretisedfield) spell it "Segement"
+        if b"# end: seg" not in f.read().lower():
+            return None
+    header['repr'] = "text" if nbytes is None else f"Binary {nbytes}"
+    return header
+
+def _read_segment(f, order="xyz", native=False, dtype=None, workers=None):
+    """Read the segment starting at the current position of `f`. See `read_ovf()`."""
+    with _phase("header", f):
+        header = _read_header(f)
+    with _phase("seek", f):
+        nbytes = _advance_to_data_block(f, _byteorder(header))
+    with _phase("decode", f):
+        data = _parse_data(f, header, nbytes, native, dtype, workers)
+    return _segment_dict(header, nbytes, data, order)
+
+# Files up to this size are read by `_read_small()`
+_small_file_bytes = 2**20
+
+_begin_header = re.compile(rb"# begin: header[^\n]*\n", re.IGNORECASE)
+_end_header = re.compile(rb"^# end: header", re.IGNORECASE | re.MULTILINE)
+_begin_data = re.compile(rb"# begin: data[ \t]+(\S+)(?:[ \t]+(\d+))?[^\n]*\n", re.IGNORECASE)
+_comment = re.compile(r"##[^\n]*")
+_header_entry = re.compile(r"^.([^:\n]*):([^\n]*)", re.MULTILINE)
+
+def _read_small(f, size, order="xyz", native=False, dtype=None):
+    """Read a whole (small) file with one call, then parse it from memory. See `read_ovf()`.
+
+    Gives the same result as `_read_segment()`, but the header is tokenized by a few 
+    regular expressions over the buffer instead of line by line, and the data are 
+    decoded with `np.frombuffer()`. Binary data is then copied once (converting 
+    dtype and byte order on the way), since it sits at an arbitrary, usually 
+    unaligned, offset in the buffer; the arrays are thus aligned, own their data, 
+    and do not keep the file buffer alive. 
+    """
+    with _phase("header", nbytes=size):
+        buffer = bytearray(size)
+        del buffer[f.readinto(buffer):]
+        first = buffer[:buffer.find(b"\n")]
+        if b"2.0" in first:
+            version = "2.0"
+        elif b"1.0" in first:
+            version = "1.0"
+        else:
+            raise ValueError("This file does not appear to be OVF 1.0 or 2.0. "
+                             "ovf2io does not support older OVF formats. ")
+        begin = _begin_header.search(buffer)
+        end = _end_header.search(buffer, begin.end()) if begin else None
+        if end is None:
+            raise Exception("End of header not found. ")
+        text = _comment.sub("", buffer[begin.end():end.start()].decode("utf-8"))
+        header = {}
+        for key, value in _header_entry.findall(text):
+            # key is case-insensitive and spaces are ignored
+            header.update(_create_header_entry(key.strip().lower(), value.strip(), header))
+        if version == "1.0":
+            header = _ovf1_header(header)
+        _check_header_keys(header, version)
+        header = _format_header(header)
+        header['version'] = version
+    with _phase("seek"):
+        match = _begin_data.search(buffer, end.end())
+        if match is None:
+            raise Exception("Beginning of data block not found. ")
+        nbytes = int(match.group(2)) if match.group(1).lower() == b"binary" else None
+        position = match.end()
+    shape, keys = _data_shape(header)
+    count = math.prod(shape)
+    file_dtype = np.dtype(_data_dtype(nbytes, _byteorder(header)))
+    block_nbytes = len(buffer) - position if nbytes is None else count * nbytes
+    with _phase("decode", nbytes=block_nbytes):
+        out_dtype = _output_dtype(file_dtype, native, dtype)
+        if nbytes is None:
+            array = np.fromstring(bytes(buffer[position:]), dtype=file_dtype, count=count, sep=" ")
+            array = _converted(array, out_dtype)
+        else:
+            code, expected = _check_values[nbytes]
+            if struct.unpack_from(_byteorder(header) + code, buffer, position)[0] != expected:
+                raise Exception("This binary file cannot be read. "
+                                "The test value does not match. ")
+            array = np.frombuffer(buffer, dtype=file_dtype, count=count, offset=position + nbytes)
+            # Copy out of the buffer into an aligned array that owns its data
+            array = array.astype(out_dtype)
+        data = _split_components(array, header)
+    return _segment_dict(header, nbytes, data, order)
+
+def _segment_dict(header, nbytes, data, order="xyz"):
+    """Generate the coordinates, and arrange everything as returned by `read_ovf()`."""
+    with _phase("coords"):
+        coords = _gen_coords(data, header)
+    if header['meshtype'] == 'rectangular' and order != "xyz":
+        axes = _axes_permutation(order)
+        data = {key: value.transpose(axes) for key, value in data.items()}
+        coords = {key: value.transpose(axes) for key, value in coords.items()}
+    header['repr'] = "text" if nbytes is None else f"Binary {nbytes}"
+    out = {
+            'data': data,
+            'coords': coords,
+            'metadata': header
+        }
     return out
 
+def _slices_per_chunk(header, nbytes, chunk_bytes=2**26):
+    """Number of slices along the last axis of the data block read at once by `_iter_data_chunks`."""
+    shape, keys = _data_shape(header)
+    itemsize = np.dtype(_data_dtype(nbytes, _byteorder(header))).itemsize
+    return max(1, chunk_bytes // (math.prod(shape[:-1]) * itemsize))
+
+def _iter_data_chunks(f, header, nbytes, chunk_bytes=2**26, slices_per_chunk=None, multiplier=None):
+    """Yield the data block in pieces of roughly `chunk_bytes`. 
+
+    Each piece is `(start, block)`, where `block` has the layout of `_parse_data`'s 
+    array, restricted to `start:start + block.shape[-1]` along the last axis 
+    (z-planes for rectangular meshes, points for irregular meshes). 
+    Rectangular meshes are always split on whole z-planes. **slices_per_chunk**, 
+    if given, overrides the number of slices derived from **chunk_bytes**. 
+    The values are multiplied by **multiplier**, taken from the header (see 
+    `_take_multiplier()`) if not given. 
+    """
+    if multiplier is None:
+        multiplier = _take_multiplier(header)
+    shape, keys = _data_shape(header)
+    sep = " " if nbytes is None else ""
+    dtype = _data_dtype(nbytes, _byteorder(header))
+    per_slice = math.prod(shape[:-1])
+    if slices_per_chunk is None:
+        slices_per_chunk = _slices_per_chunk(header, nbytes, chunk_bytes)
+    for start in range(0, shape[-1], slices_per_chunk):
+        n = min(slices_per_chunk, shape[-1] - start)
+        block = np.fromfile(f, count=per_slice * n, sep=sep, dtype=dtype)
+        if block.size != per_slice * n:
+            raise Exception("Data block is shorter than the header specifies. ")
+        yield start, _scale_values(block.reshape(shape[:-1] + (n,), order='F'), header, multiplier)
+
 def _gen_coords(data, header):
     if header['meshtype'] == 'rectangular':
         xcoords = header['xmin'] + header['xstepsize'] * (1/2 + np.arange(header['xnodes']))
@@ -151,10 +467,13 @@ def _gen_coords(data, header):
         z = data.pop("z")
         return {'x': x, 'y': y, 'z': z}
 
-def _check_first_byte(f, nbytes):
-    binrep = {4: ("<f", 1234567.0), 8: ("<d", 123456789012345.0)}
-    test_value = struct.unpack(binrep[nbytes][0], f.read(nbytes))[0]
-    if test_value != binrep[nbytes][1]:
+# struct format and value of the check value at the start of binary data blocks
+_check_values = {4: ("f", 1234567.0), 8: ("d", 123456789012345.0)}
+
+def _check_first_byte(f, nbytes, byteorder="<"):
+    code, expected = _check_values[nbytes]
+    test_value = struct.unpack(byteorder + code, f.read(nbytes))[0]
+    if test_value != expected:
         raise Exception("This binary file cannot be read. "
                         "The test value does not match. ")
     
@@ -199,6 +518,109 @@ def _shape_desc(desc):
         s += "\n# desc: " + line
     return s
 
+_masked_grid_keys = ("xnodes", "ynodes", "znodes", "xbase", "ybase", "zbase",
+                     "xstepsize", "ystepsize", "zstepsize")
+
+def _masked_grid_desc(shape, p0, cellsize):
+    """Desc line recording the rectangular grid of a file written by `write_ovf_masked()`."""
+    values = tuple(shape[:3]) + tuple(p0) + tuple(cellsize)
+    return "ovf2io masked grid: " + " ".join(f"{key}={value}"
+                                            for key, value in zip(_masked_grid_keys, values))
+
+def _parse_masked_grid_desc(header):
+    """Recover the grid written by `_masked_grid_desc()`, or `None` if there is none."""
+    for line in header.get("desc", []):
+        if line.startswith("ovf2io masked grid:"):
+            pairs = dict(pair.split("=") for pair in line.partition(":")[2].split())
+            return {key: (int if key.endswith("nodes") else float)(pairs[key])
+                    for key in _masked_grid_keys}
+    return None
+
+def _prepare_rectangular(data, p0=(0., 0., 0.,), cellsize=None, x=None, y=None, z=None,
+        title="title", desc=[], meshunit="m", valueunits=[], valuelabels=[],
+        representation="bin8", order="xyz"):
+    """Validate the arguments of `write_ovf_rectangular()`, and build the header. 
+
+    Returns the header and the data, as an `(x, y, z, component)`-indexed view. 
+    """
+    data = np.asarray(data)
+    if len(data.shape) != 4:
+        raise Exception("Data should have shape (N_x, N_y, N_z, N_data_components).")
+    if order != "xyz":
+        _axes_permutation(order)
+        data = data.transpose(tuple(order.index(axis) for axis in "xyz") + (3,))
+
+    # Add a line to desc saying generated by ovf2io
+    desc = _shape_desc(desc)
+    valuedim = data.shape[-1]
+
+    # Generate valueunits and valuelabels
+    valueunits = _generate_valueunits_list(valueunits, valuedim)
+    valuelabels = _generate_valuelabels_list(valuelabels, valuedim)
+
+    if x is not None and y is not None and z is not None:
+        if len(x) != data.shape[0] or len(y) != data.shape[1] or len(z) != data.shape[2]:
+            raise ValueError("Coordinate dimensions incorrect; lengths of x, y, and z "
+                             "should match the data's first, second, and third axes, respectively. ")
+        p0 = (x[0], y[0], z[0])
+        cellsize = (np.abs(x[1]-x[0]), np.abs(y[1]-y[0]), np.abs(z[1]-z[0]))
+    elif x is not None or y is not None or z is not None:
+        raise Exception("x, y, and z should all be given or none given.")
+    # If no x/y/z, but also no cellsize
+    elif cellsize is None:
+        cellsize = (1., 1., 1.)
+        meshunit = "pt"
+    header = {
+        "title": title, "desc": desc, "meshunit": meshunit, "meshtype": "rectangular",
+        "valueunits": valueunits, "valuelabels": valuelabels, "valuedim": valuedim,
+        "xbase": p0[0], "ybase": p0[1], "zbase": p0[2], 
+        "xstepsize": cellsize[0], "ystepsize": cellsize[1], "zstepsize": cellsize[2],
+        "xnodes": data.shape[0], "ynodes": data.shape[1], "znodes": data.shape[2],
+        "xmin": p0[0] - 0.5 * cellsize[0], "xmax": p0[0] + (data.shape[0] - 0.5) * cellsize[0],
+        "ymin": p0[1] - 0.5 * cellsize[1], "ymax": p0[1] + (data.shape[1] - 0.5) * cellsize[1],
+        "zmin": p0[2] - 0.5 * cellsize[2], "zmax": p0[2] + (data.shape[2] - 0.5) * cellsize[2]
+    }
+    if not representation.lower() in {"text", "bin4", "bin8"}:
+        raise ValueError("Representation must be either 'text', 'bin4', or 'bin8'.")
+    return header, data
+
+def _prepare_irregular(data, points=None, cellsize=(0., 0., 0.), title="title", desc=[],
+        meshunit="m", valueunits=[], valuelabels=[], representation="bin8"):
+    """Validate the arguments of `write_ovf_irregular()`, and build the header. 
+
+    Returns the header and the rows of the data block, points first. 
+    """
+    data = np.array(data)
+    if len(data.shape) != 2:
+        raise Exception("Data should have shape (N_points, N_data_components).")
+
+    # Add a line to desc saying generated by ovf2io
+    desc = _shape_desc(desc)
+    valuedim = data.shape[-1]
+    valueunits = _generate_valueunits_list(valueunits, valuedim)
+    valuelabels = _generate_valuelabels_list(valuelabels, valuedim)
+
+    if points is None:
+        points = np.zeros((data.shape[0], 3))
+        points[:, 0] = np.arange(data.shape[0])
+        cellsize = (1., 1., 1.)
+        meshunit = "pt"
+
+    header = {
+        "title": title, "desc": desc, "meshunit": meshunit, "meshtype": "irregular",
+        "valueunits": valueunits, "valuelabels": valuelabels, "valuedim": valuedim,
+        "pointcount": data.shape[0],
+        "xmin": np.min(points[:,0]) - 0.5 * cellsize[0], "xmax": np.max(points[:,0]) + 0.5 * cellsize[0],
+        "ymin": np.min(points[:,1]) - 0.5 * cellsize[1], "ymax": np.max(points[:,1]) + 0.5 * cellsize[1],
+        "zmin": np.min(points[:,2]) - 0.5 * cellsize[2], "zmax": np.max(points[:,2]) + 0.5 * cellsize[2],
+    }
+    if not representation.lower() in {"text", "bin4", "bin8"}:
+        raise ValueError("Representation must be either 'text', 'bin4', or 'bin8'.")
+    reshaped = np.zeros((data.shape[0], data.shape[1] + 3))
+    reshaped[:, :3] = points
+    reshaped[:, 3:] = data
+    return header, reshaped
+
 def _make_header(header, representation):
     rep = {"text": "text", "bin4": "Binary 4", "bin8": "Binary 8"}[representation]
     if header['meshtype'] == 'rectangular':
@@ -210,17 +632,46 @@ def _make_header(header, representation):
     frontmatter = frontmatter.replace("[repr]", rep)
     return frontmatter
 
-def _write_file(fname, frontmatter, representation, reshaped):
+def _axes_permutation(order):
+    """Axes of an `(x, y, z)`-indexed array, in the given `order`, e.g. `(1, 0, 2)` for "yxz"."""
+    if sorted(order) != ["x", "y", "z"]:
+        raise ValueError("order must be a permutation of 'xyz', e.g. 'yxz'. ")
+    return tuple("xyz".index(axis) for axis in order)
+
+def _iter_rows(data, chunk_elements=2**22):
+    """Yield the rows of the data block, in file order. 
+
+    `data` is either an array of rows with shape `(N_rows, N_columns)`, or an array with 
+    shape `(N_x, N_y, N_z, N_data_components)` (possibly a strided view), which is 
+    reordered a few z-planes at a time so that it is never copied as a whole. 
+    """
+    if data.ndim == 2:
+        yield data
+        return
+    planes = max(1, chunk_elements // max(1, data.shape[0] * data.shape[1] * data.shape[3]))
+    for k in range(0, data.shape[2], planes):
+        yield data[:, :, k:k + planes, :].transpose(2, 1, 0, 3).reshape((-1, data.shape[-1]))
+
+def _write_file(fname, frontmatter, representation, data):
     with open(fname, "wb") as f:
-        f.write(frontmatter.encode("utf-8"))
-        binrep = {"bin4": ("<f", 1234567.0), "bin8": ("<d", 123456789012345.0)}
+        _write_segment(f, frontmatter, representation, data)
+
+def _write_segment(f, frontmatter, representation, data):
+    """Write one segment to the open file `f`, and return the offset of its first data value."""
+    f.write(frontmatter.encode("utf-8"))
+    binrep = {"bin4": ("<f", 1234567.0), "bin8": ("<d", 123456789012345.0)}
+    with _phase("encode", f):
         if representation in binrep:
             f.write(struct.pack(*binrep[representation]))
-            f.write(reshaped.astype(binrep[representation][0]).tobytes())
+            data_offset = f.tell()
+            for rows in _iter_rows(data):
+                f.write(np.ascontiguousarray(rows, dtype=binrep[representation][0]))
             f.write("\n".encode("utf-8"))
         else:
-            np.savetxt(f, reshaped)
-        rep = {"text": "text", "bin4": "Binary 4", "bin8": "Binary 8"}[representation]
-        f.write(f"# End: Data {rep}".encode("utf-8"))
-        f.write("\n# End: Segment".encode("utf-8"))
-
+            data_offset = f.tell()
+            for rows in _iter_rows(data):
+                np.savetxt(f, rows)
+    rep = {"text": "text", "bin4": "Binary 4", "bin8": "Binary 8"}[representation]
+    f.write(f"# End: Data {rep}".encode("utf-8"))
+    f.write("\n# End: Segment".encode("utf-8"))
+    return data_offset
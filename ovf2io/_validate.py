@@ -0,0 +1,122 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from . import _utils as ut
+
+def _hash_range(f, start, stop, checksum, blocksize=2**20):
+    """Hash the bytes of `f` from `start` up to `stop` (or the end of the file if `stop` is None)."""
+    h = hashlib.new(checksum)
+    f.seek(start)
+    remaining = stop - start if stop is not None else None
+    while remaining is None or remaining > 0:
+        block = f.read(blocksize if remaining is None else min(blocksize, remaining))
+        if not block:
+            break
+        h.update(block)
+        if remaining is not None:
+            remaining -= len(block)
+    return h.hexdigest()
+
+def _validate_one(fname, checksum=None):
+    report = {"path": Path(fname), "valid": False, "errors": [], "warnings": [],
+              "repr": None, "data_offset": None, "expected_nbytes": None,
+              "file_nbytes": None, "trailer": False, "hash": None}
+    try:
+        f = open(fname, "rb")
+    except OSError as e:
+        report["errors"].append(str(e))
+        return report
+    with f, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        size = os.fstat(f.fileno()).st_size
+        report["file_nbytes"] = size
+        try:
+            # Checks the header keys and the binary check value
+            header = ut._read_header(f)
+            nbytes = ut._advance_to_data_block(f, ut._byteorder(header))
+        except StopIteration:
+            report["errors"].append("File ended before the data block. ")
+            return report
+        except Exception as e:
+            report["errors"].append(str(e))
+            return report
+        finally:
+            report["warnings"] = [str(w.message) for w in caught]
+        report["repr"] = "text" if nbytes is None else f"Binary {nbytes}"
+        # Offset of the check value for binary files, or of the first number for text
+        start = f.tell() - (nbytes or 0)
+        report["data_offset"] = start
+        expected = ut._data_block_nbytes(header, nbytes)
+        report["expected_nbytes"] = expected
+        f.seek(max(0, size - 64))
+        report["trailer"] = b"# end: seg" in f.read().lower()
+        if not report["trailer"]:
+            report["errors"].append("'# End: Segment' trailer not found. ")
+        if expected is not None:
+            f.seek(start + expected)
+            after = f.read(64).lstrip().lower()
+            if start + expected > size:
+                report["errors"].append(f"Data block is {start + expected - size} bytes "
+                                        "shorter than the header specifies. ")
+            elif not after.startswith(b"# end: data"):
+                report["errors"].append("Data block is longer than the header specifies. ")
+        if checksum is not None and not report["errors"]:
+            report["hash"] = _hash_range(f, start, None if expected is None else start + expected,
+                                         checksum)
+    report["valid"] = not report["errors"]
+    return report
+
+def validate_ovf(paths, workers=None, checksum=None):
+    """Check the structure of .ovf files without decoding their data.
+
+    For each file, the header keys are checked, as is the check value of binary
+    files. The file size is compared to the data block size given by the header,
+    `xnodes*ynodes*znodes*valuedim` (or `pointcount*(3 + valuedim)`) values plus the
+    check value, and the `# End: Segment` trailer must be present.
+    The size of text data blocks is not checked, since that requires parsing them.
+
+    **Parameters**
+
+    * **paths** : _str, Path, or list_ <br />
+    The file(s) to check.
+
+    * **workers** : _int, optional_ <br />
+    Number of worker processes. If not given, files are checked one after another.
+
+    * **checksum** : _str, optional_ <br />
+    Name of a `hashlib` algorithm, e.g. `"sha256"`. If given, a hash of the data block
+    (of the check value and the data, for binary files) is computed for valid files,
+    e.g. to find duplicates.
+
+    **Returns**
+
+    * **reports** : _list of dict_ <br />
+    One report per file, in the order given. Each report has the keys `'path'`,
+    `'valid'`, `'errors'`, `'warnings'`, `'repr'`, `'data_offset'`, `'expected_nbytes'`,
+    `'file_nbytes'`, `'trailer'` and `'hash'`.
+    """
+    paths = [paths] if isinstance(paths, (str, Path)) else list(paths)
+    if checksum is not None:
+        # Fail early on an unknown algorithm
+        hashlib.new(checksum)
+    if workers is None or workers <= 1:
+        return [_validate_one(fname, checksum) for fname in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_validate_one, paths, [checksum] * len(paths), chunksize=16))
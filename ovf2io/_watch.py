@@ -0,0 +1,147 @@
+# ovf2io is a utility for OOMMF Vector Field (.ovf) IO developed by WSP as a member of the McMorran Lab
+# Copyright (C) 2023  William S. Parker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from . import _utils as ut
+
+def _open_inotify(directory):
+    """Watch `directory` with inotify if `inotify_simple` is installed, else return `None`."""
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return None
+    try:
+        inotify = INotify()
+        # A file is complete once closed after writing, or moved into place
+        inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+    except OSError:
+        return None
+    return inotify
+
+def _inotify_names(inotify, directory, timeout):
+    """Names of the files with events within `timeout` seconds, or all files if events were lost."""
+    from inotify_simple import flags
+    events = inotify.read(timeout=int(1000 * timeout))
+    if any(event.mask & flags.Q_OVERFLOW for event in events):
+        return sorted(os.listdir(directory))
+    return sorted({event.name for event in events if event.name})
+
+def watch_ovf(directory, pattern="*.ovf", read_data=False, poll_interval=1.,
+        timeout=None, existing=True):
+    """Yield .ovf files from `directory` as they are completely written.
+
+    Intended for monitoring the output directory of a running simulation.
+    A file is yielded once its `# End: Segment` trailer is present and, for binary
+    files, its data block has the size given by the header; files that are still
+    being written are picked up again once they are closed (with inotify) or
+    change (without). A file that is rewritten
+    is yielded again. Only files that changed since the last check are opened.
+
+    New files are detected with inotify when the optional `inotify_simple` package
+    is installed, and by listing the directory every **poll_interval** seconds otherwise.
+
+    ```python
+    for fname, metadata in ovf2io.watch_ovf("run.out", pattern="m*.ovf"):
+        print(fname, metadata['title'])
+    ```
+
+    **Parameters**
+
+    * **directory** : _str or Path_ <br />
+    The directory to watch.
+
+    * **pattern** : _str, optional_ <br />
+    Shell-style pattern that file names must match. <br />
+    Default is `pattern = "*.ovf"`.
+
+    * **read_data** : _bool, optional_ <br />
+    If `True`, yield the output of `read_ovf()` instead of just the header. <br />
+    Default is `read_data = False`.
+
+    * **poll_interval** : _float, optional_ <br />
+    Seconds between checks for changes. <br />
+    Default is `poll_interval = 1.`.
+
+    * **timeout** : _float, optional_ <br />
+    Stop after this many seconds without a new complete file.
+    If not given, watch indefinitely.
+
+    * **existing** : _bool, optional_ <br />
+    If `True`, files already in the directory are yielded first. <br />
+    Default is `existing = True`.
+
+    **Yields**
+
+    * **fname** : _Path_ <br />
+    The completed file.
+
+    * **file** : _dict_ <br />
+    The header (the `'metadata'` entry of `read_ovf()`), or the full output of
+    `read_ovf()` if **read_data** is `True`.
+    """
+    from . import read_ovf
+    directory = Path(directory)
+    # (mtime, size) of each file when it was last checked
+    checked = {}
+
+    def changed(names):
+        for name in names:
+            if not fnmatch(name, pattern):
+                continue
+            fname = directory.joinpath(name)
+            try:
+                stat = fname.stat()
+            except FileNotFoundError:
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            if checked.get(name) != key:
+                checked[name] = key
+                yield fname
+
+    # Watch before listing, so that no file is missed in between. Events for files
+    # that are also in the listing are skipped by `changed()` if nothing changed
+    inotify = _open_inotify(directory)
+    last_found = time.monotonic()
+    try:
+        names = sorted(os.listdir(directory))
+        if not existing:
+            for fname in changed(names):
+                pass
+        while True:
+            for fname in changed(names):
+                header = ut._complete_header(fname)
+                if header is None:
+                    continue
+                if read_data:
+                    try:
+                        header = read_ovf(fname)
+                    except OSError:
+                        # Removed or replaced since it was checked
+                        continue
+                yield fname, header
+                last_found = time.monotonic()
+            if timeout is not None and time.monotonic() - last_found > timeout:
+                return
+            if inotify is not None:
+                names = _inotify_names(inotify, directory, poll_interval)
+            else:
+                time.sleep(poll_interval)
+                names = sorted(os.listdir(directory))
+    finally:
+        if inotify is not None:
+            inotify.close()
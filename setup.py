@@ -20,5 +20,7 @@ setup(
     long_description = open('README.md').read(),
     long_description_content_type = "text/markdown",
 	python_requires='>=3.6',
-    install_requires=['numpy']
+    install_requires=['numpy'],
+    extras_require={'hdf5': ['h5py'], 'zarr': ['zarr'], 'watch': ['inotify_simple']},
+    entry_points={'console_scripts': ['ovf2io = ovf2io._cli:main']},
 )
@@ -0,0 +1,93 @@
+"""Files-per-second of `read_ovf` on many small files, against a baseline revision.
+
+The baseline `ovf2io` is taken from git (by default the last commit before the
+single-call small-file path was added) and timed in a separate process, so both
+versions read the same files. The current line-by-line streaming path
+(`_read_segment`, still used for files over 1 MiB) is reported as well.
+
+    python bench_small_files.py [n_files] [baseline_revision] > bench_output.txt
+"""
+import json
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+import numpy as np
+import ovf2io as ovf
+
+REPO = Path(__file__).resolve().parent.parent
+BASELINE = "962858e"
+
+# Run in a subprocess with the package under test first on sys.path
+TIMER = """
+import json, os, sys, time
+import ovf2io as ovf
+def streamed(fname):
+    with open(fname, "rb") as f:
+        return ovf.ut._read_segment(f)
+readers = {"read_ovf": ovf.read_ovf, "streamed": streamed}
+files = json.load(sys.stdin)
+out = {}
+for case, fnames in files.items():
+    for name, read in readers.items():
+        if name == "streamed" and sys.argv[1] == "baseline":
+            continue
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            for fname in fnames:
+                read(fname)
+            best = min(best, time.perf_counter() - start)
+        out[f"{case}/{name}"] = len(fnames) / best
+print(json.dumps(out))
+"""
+
+def make_files(directory, n_files):
+    rng = np.random.default_rng(0)
+    cases = {
+        "trace_1d_bin8": lambda fname: ovf.write_ovf_rectangular(
+            rng.random((64, 1, 1, 3)), fname, cellsize=(1e-9, 1e-9, 1e-9),
+            valuelabels=["m_x", "m_y", "m_z"], valueunits=["1"]),
+        "probe_irregular_text": lambda fname: ovf.write_ovf_irregular(
+            rng.random((16, 1)), fname, points=rng.random((16, 3)),
+            valuelabels=['"probe value"'], valueunits=["A/m"], representation="text"),
+        "plane_32x32_bin4": lambda fname: ovf.write_ovf_rectangular(
+            rng.random((32, 32, 1, 3)), fname, cellsize=(1e-9, 1e-9, 1e-9),
+            representation="bin4"),
+    }
+    files = {}
+    for case, write in cases.items():
+        files[case] = [str(Path(directory).joinpath(f"{case}_{i}.ovf")) for i in range(n_files)]
+        for fname in files[case]:
+            write(fname)
+    return files
+
+def extract(revision, directory):
+    """Write the `ovf2io` package at `revision` to `directory`."""
+    archive = subprocess.run(["git", "-C", str(REPO), "archive", revision, "ovf2io"],
+                             check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+def time_package(path, files, label):
+    result = subprocess.run([sys.executable, "-c", TIMER, label], input=json.dumps(files),
+                            env={"PYTHONPATH": str(path)}, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+if __name__ == "__main__":
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    revision = sys.argv[2] if len(sys.argv) > 2 else BASELINE
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_files(directory, n_files)
+        baseline_dir = Path(directory).joinpath("baseline")
+        extract(revision, baseline_dir)
+        before = time_package(baseline_dir, files, "baseline")
+        after = time_package(REPO, files, "current")
+    print(f"{n_files} files per case; baseline is read_ovf at {revision}")
+    print(f"{'case':<24}{'baseline':>12}{'streamed':>12}{'read_ovf':>12}{'speedup':>10}  (files/s)")
+    for case in files:
+        base = before[f"{case}/read_ovf"]
+        now = after[f"{case}/read_ovf"]
+        print(f"{case:<24}{base:>12.0f}{after[f'{case}/streamed']:>12.0f}{now:>12.0f}{now / base:>10.2f}")
@@ -12,3 +12,55 @@ field = df.Field(mesh=mesh, dim=3, value=values)
 field.write("test_ovfs/df_bin8_rectangular.ovf", representation="bin8")
 field.write("test_ovfs/df_bin4_rectangular.ovf", representation="bin4")
 field.write("test_ovfs/df_text_rectangular.ovf", representation="txt")
+
+######## OVF 1.0 (written by hand, since current tools only write OVF 2.0)
+ovf1_header = """# OOMMF: {meshtype} mesh v1.0
+# Segment count: 1
+# Begin: Segment
+# Begin: Header
+# Title: Field
+# Desc: OVF 1.0 test file
+# meshunit: m
+# meshtype: {meshtype}
+{mesh}# xmin: -0.5
+# ymin: -0.5
+# zmin: -0.5
+# xmax: 1.5
+# ymax: 2.5
+# zmax: 3.5
+# valueunit: A/m
+# valuemultiplier: {multiplier}
+# ValueRangeMinMag: 1e-8
+# ValueRangeMaxMag: 3
+# End: Header
+# Begin: Data {repr}
+"""
+rectangular_mesh = """# xbase: 0.0
+# ybase: 0.0
+# zbase: 0.0
+# xstepsize: 1.0
+# ystepsize: 1.0
+# zstepsize: 1.0
+# xnodes: 2
+# ynodes: 3
+# znodes: 4
+"""
+rows = values.transpose(2, 1, 0, 3).reshape((-1, 3))
+points = np.einsum('i...->...i', np.array([x, y, z])).transpose(2, 1, 0, 3).reshape((-1, 3))
+
+def write_ovf1(fname, meshtype, mesh, multiplier, rep, data):
+    with open(fname, "wb") as f:
+        f.write(ovf1_header.format(meshtype=meshtype, mesh=mesh, multiplier=multiplier, repr=rep).encode())
+        if rep == "Text":
+            np.savetxt(f, data)
+        else:
+            dtype, check = {"Binary 4": (">f4", 1234567.0), "Binary 8": (">f8", 123456789012345.0)}[rep]
+            f.write(np.array(check, dtype=dtype).tobytes())
+            f.write(data.astype(dtype).tobytes())
+            f.write(b"\n")
+        f.write(f"# End: Data {rep}\n# End: Segment\n".encode())
+
+write_ovf1("reading_tests/ovf1_bin4_rectangular.ovf", "rectangular", rectangular_mesh, 2, "Binary 4", rows / 2)
+write_ovf1("reading_tests/ovf1_text_rectangular.ovf", "rectangular", rectangular_mesh, 1, "Text", rows)
+write_ovf1("reading_tests/ovf1_bin8_irregular.ovf", "irregular", "# pointcount: 24\n", 1, "Binary 8",
+           np.concatenate((points, rows), axis=1))
@@ -1,4 +1,8 @@
+import json
+import os
+import shutil
 import numpy as np
+import pytest
 import ovf2io as ovf
 
 X = np.arange(0, 2)
@@ -50,3 +54,274 @@ def test_bin4_header():
 def test_bin8_header():
     data = ovf.read_ovf("reading_tests/df_bin8_rectangular.ovf")
     assert(header_keys < set(data['metadata'].keys()))
+
+def test_phase_counters():
+    with ovf.PhaseCounters() as counters:
+        ovf.read_ovf("reading_tests/df_bin8_rectangular.ovf")
+    phases = counters.as_dict()
+    assert(set(phases.keys()) == {"header", "seek", "decode", "coords"})
+    assert(phases['decode']['nbytes'] == 8 * 2 * 3 * 4 * 3)
+    assert(all(phase['calls'] == 1 for phase in phases.values()))
+    assert(ovf._instrument._observers == [])
+
+def test_convert_npy(tmp_path):
+    for rep in ["text", "bin4", "bin8"]:
+        dst = tmp_path.joinpath(f"{rep}.npy")
+        ovf.convert_ovf(f"reading_tests/df_{rep}_rectangular.ovf", dst, chunk_bytes=1)
+        converted = np.load(dst)
+        assert(converted.shape == (2, 3, 4, 3))
+        assert(np.allclose(converted, values))
+        assert(dst.with_suffix(".json").exists())
+
+def test_convert_chunks(tmp_path):
+    from ovf2io._convert import _storage_chunks
+    # Chunks span whole slabs, and slabs are whole chunks
+    assert(_storage_chunks((256, 256, 64, 3), 8, 5) == ((256, 256, 2, 3), 4))
+    assert(_storage_chunks((4096, 4096, 8, 3), 8, 1) == ((4096, 42, 1, 3), 1))
+    assert(_storage_chunks((10, 6), 8, 1000) == ((10, 6), 1000))
+    h5py = pytest.importorskip("h5py")
+    dst = tmp_path.joinpath("data.h5")
+    ovf.convert_ovf("reading_tests/df_bin8_rectangular.ovf", dst, format="hdf5", chunk_bytes=2 * 3 * 3 * 8)
+    with h5py.File(dst, "r") as f:
+        assert(f['data'].chunks == (2, 3, 1, 3))
+        assert(np.allclose(f['data'][...], values))
+
+def test_cli(tmp_path, capsys):
+    from ovf2io._cli import main
+    assert(main(["info", "reading_tests"]) == 0)
+    assert("valuelabels" in capsys.readouterr().out)
+    assert(main(["stats", "reading_tests/df_bin8_rectangular.ovf"]) == 0)
+    assert("field_y: count=24 min=0 max=2" in capsys.readouterr().out)
+    assert(main(["convert", "-o", str(tmp_path), "-j", "2", "reading_tests"]) == 0)
+    assert(len(list(tmp_path.glob("*.npy"))) == len(os.listdir("reading_tests")))
+    # The same file names in two directories are prefixed with the directory name
+    for run in ["run1", "run2"]:
+        tmp_path.joinpath(run).mkdir()
+        shutil.copy("reading_tests/df_bin8_rectangular.ovf", tmp_path.joinpath(run))
+    out = tmp_path.joinpath("out")
+    assert(main(["convert", "-o", str(out), str(tmp_path / "run1"), str(tmp_path / "run2")]) == 0)
+    assert(sorted(p.name for p in out.glob("*.npy"))
+           == ["run1_df_bin8_rectangular.npy", "run2_df_bin8_rectangular.npy"])
+    assert(main(["convert", "-o", str(out), "reading_tests/df_bin8_rectangular.ovf",
+                 "reading_tests/df_bin8_rectangular.ovf"]) == 1)
+
+def test_watch_ovf(tmp_path):
+    complete = open("reading_tests/df_bin8_rectangular.ovf", "rb").read()
+    tmp_path.joinpath("partial.ovf").write_bytes(complete[:len(complete) // 2])
+    tmp_path.joinpath("complete.ovf").write_bytes(complete)
+    found = [fname.name for fname, header in ovf.watch_ovf(tmp_path, poll_interval=0.01, timeout=0.05)]
+    assert(found == ["complete.ovf"])
+
+def test_validate_ovf(tmp_path):
+    fnames = [f"reading_tests/df_{rep}_rectangular.ovf" for rep in ["text", "bin4", "bin8"]]
+    complete = open(fnames[2], "rb").read()
+    tmp_path.joinpath("truncated.ovf").write_bytes(complete[:-200])
+    fnames.append(tmp_path.joinpath("truncated.ovf"))
+    reports = ovf.validate_ovf(fnames, workers=2, checksum="sha256")
+    assert([report['valid'] for report in reports] == [True, True, True, False])
+    assert(reports[2]['expected_nbytes'] == 8 * (2 * 3 * 4 * 3 + 1))
+    assert(reports[2]['hash'] is not None)
+    assert(not reports[3]['trailer'])
+
+def test_irregular_mesh_index(tmp_path):
+    rng = np.random.default_rng(0)
+    points = rng.random((1000, 3))
+    fname = tmp_path.joinpath("irregular.ovf")
+    ovf.write_ovf_irregular(points[:, :1], fname, points=points)
+    # The second time round, the index is loaded from disk
+    for attempt in range(2):
+        mesh = ovf.IrregularMesh.from_file(fname, persist=True)
+        assert(tmp_path.joinpath("irregular.ovf.idx.npz").exists())
+        queries = rng.random((50, 3))
+        d, i = mesh.nearest(queries)
+        brute = np.linalg.norm(points[np.newaxis] - queries[:, np.newaxis], axis=-1)
+        assert(np.array_equal(i, brute.argmin(axis=1)))
+        assert(np.allclose(d, brute.min(axis=1)))
+        box = mesh.query_box((0.2, 0.3, 0.4), (0.5, 0.6, 0.7))
+        assert(np.array_equal(box, np.nonzero(np.all((points >= (0.2, 0.3, 0.4))
+                                                     & (points <= (0.5, 0.6, 0.7)), axis=1))[0]))
+        near = mesh.query_radius(queries, 0.1)
+        assert(all(np.array_equal(near[n], np.nonzero(brute[n] <= 0.1)[0]) for n in range(50)))
+        radii = np.linspace(0., 0.3, 50)
+        near = mesh.query_radius(queries, radii)
+        assert(all(np.array_equal(near[n], np.nonzero(brute[n] <= radii[n])[0]) for n in range(50)))
+        boxes = mesh.query_box(queries - 0.1, queries + 0.2)
+        assert(all(np.array_equal(boxes[n], np.nonzero(np.all((points >= queries[n] - 0.1)
+                                                              & (points <= queries[n] + 0.2), axis=1))[0])
+                   for n in range(50)))
+    for bad in [np.nan, np.inf, -np.inf]:
+        with pytest.raises(ValueError):
+            mesh.nearest([bad, 0., 0.])
+        with pytest.raises(ValueError):
+            mesh.query_radius([[0., 0., 0.], [0., bad, 0.]], 0.1)
+        with pytest.raises(ValueError):
+            mesh.query_radius([0., 0., 0.], bad)
+        with pytest.raises(ValueError):
+            mesh.query_box((0., 0., bad), (1., 1., 1.))
+    grid = mesh.to_rectangular((0.1, 0.1, 0.1), (0.2, 0.2, 0.2), (5, 5, 5))
+    assert(grid['data']['value_0'].shape == (5, 5, 5))
+    assert(np.abs(grid['data']['value_0'] - grid['coords']['x']).max() < 0.2)
+
+def test_ovf1_reading():
+    for rep in ["bin4", "text"]:
+        data = ovf.read_ovf(f"reading_tests/ovf1_{rep}_rectangular.ovf")
+        assert(np.allclose(data['data']['value_0'], x))
+        assert(np.allclose(data['data']['value_2'], z))
+        assert(np.allclose(data['coords']['y'], y))
+        assert(data['metadata']['version'] == "1.0")
+        assert(data['metadata']['valueunits'] == ["A/m"] * 3)
+    data = ovf.read_ovf("reading_tests/ovf1_bin8_irregular.ovf")
+    assert(data['data']['value_1'].dtype.byteorder == ">")
+    assert(np.allclose(data['data']['value_1'], y.ravel(order='F')))
+    assert(np.allclose(data['coords']['z'], z.ravel(order='F')))
+    data = ovf.read_ovf("reading_tests/ovf1_bin8_irregular.ovf", native=True)
+    assert(data['data']['value_1'].dtype.isnative)
+    assert(np.allclose(data['data']['value_1'], y.ravel(order='F')))
+
+def test_parallel_decode(monkeypatch):
+    calls = []
+    parallel_reader = ovf.ut._read_binary_parallel
+    def counting_reader(*args, **kwargs):
+        calls.append(args)
+        return parallel_reader(*args, **kwargs)
+    monkeypatch.setattr(ovf.ut, "_read_binary_parallel", counting_reader)
+    for fname in sorted(os.listdir("reading_tests")):
+        if "bin" not in fname:
+            continue
+        serial = ovf.read_ovf(f"reading_tests/{fname}")
+        for dtype in [None, np.float64]:
+            parallel = ovf.read_ovf(f"reading_tests/{fname}", workers=4, dtype=dtype, native=True)
+            for key, value in serial['data'].items():
+                assert(parallel['data'][key].dtype.isnative)
+                assert(np.array_equal(parallel['data'][key], value))
+    data = ovf.read_ovf("reading_tests/ovf1_bin4_rectangular.ovf", workers=3, dtype=np.float64)
+    assert(data['data']['value_0'].dtype == np.float64)
+    assert(np.allclose(data['data']['value_0'], x))
+    # Two reads of each binary fixture, and the one above
+    n_binary = sum("bin" in fname for fname in os.listdir("reading_tests"))
+    assert(len(calls) == 2 * n_binary + 1)
+
+def test_open_ovf():
+    for fname in sorted(os.listdir("reading_tests")):
+        for order in ["xyz", "zyx"]:
+            eager = ovf.read_ovf(f"reading_tests/{fname}", order=order)
+            lazy = ovf.open_ovf(f"reading_tests/{fname}", order=order)
+            assert(lazy.metadata == eager['metadata'])
+            assert(list(lazy.data) == list(eager['data']))
+            for key, value in eager['data'].items():
+                assert(lazy[key].shape == value.shape)
+                assert(np.array_equal(lazy[key], value))
+            for key, value in eager['coords'].items():
+                assert(np.array_equal(lazy.coords[key], value))
+    lazy = ovf.open_ovf("reading_tests/ovf1_bin4_rectangular.ovf", dtype=np.float64)
+    assert(lazy['value_1'] is lazy['value_1'])
+    assert(lazy['value_1'].dtype == np.float64)
+    assert(np.allclose(lazy.vector()[..., 1], y))
+    assert(lazy.vector().shape == x.shape + (3,))
+    lazy = ovf.open_ovf("reading_tests/ovf1_bin8_irregular.ovf", native=True)
+    assert(lazy['value_2'].dtype.isnative)
+    assert(np.allclose(lazy['value_2'], z.ravel(order='F')))
+
+def test_small_file_path():
+    for fname in sorted(os.listdir("reading_tests")):
+        with open(f"reading_tests/{fname}", "rb") as f:
+            streamed = ovf.ut._read_segment(f)
+        with open(f"reading_tests/{fname}", "rb") as f:
+            small = ovf.ut._read_small(f, os.path.getsize(f"reading_tests/{fname}"))
+        assert(small['metadata'] == streamed['metadata'])
+        for kind in ['data', 'coords']:
+            assert(list(small[kind]) == list(streamed[kind]))
+            for key, value in streamed[kind].items():
+                assert(small[kind][key].dtype == value.dtype)
+                assert(small[kind][key].flags.writeable)
+                assert(small[kind][key].flags.aligned)
+                assert(np.array_equal(small[kind][key], value))
+    assert(ovf.ut._split_labels('m_x "m y" m_z') == ["m_x", "m y", "m_z"])
+    assert(ovf.ut._split_labels("A/m A/m") == ["A/m", "A/m"])
+
+def test_resample(tmp_path):
+    fname = tmp_path.joinpath("fine.ovf")
+    X, Y, Z = np.arange(8.), np.arange(6.), np.arange(4.)
+    xx, yy, zz = np.meshgrid(X, Y, Z, indexing='ij')
+    values = np.stack((xx + 2 * yy - zz, np.random.default_rng(0).random(xx.shape)), axis=-1)
+    ovf.write_ovf_rectangular(values, fname, cellsize=(1., 1., 1.))
+    full = ovf.read_ovf(fname)
+    # A single z-plane per slab
+    options = {"chunk_bytes": 1}
+    same = ovf.read_ovf(fname, resample=dict(cellsize=1., method="nearest", **options))
+    for key in ['value_0', 'value_1']:
+        assert(np.array_equal(same['data'][key], full['data'][key]))
+    coarse = ovf.read_ovf(fname, resample=dict(cellsize=2., method="block_mean", **options))
+    assert(coarse['data']['value_1'].shape == (4, 3, 2))
+    assert(np.allclose(coarse['data']['value_1'],
+                       values[..., 1].reshape((4, 2, 3, 2, 2, 2)).mean(axis=(1, 3, 5))))
+    assert(coarse['metadata']['xstepsize'] == 2. and coarse['metadata']['znodes'] == 2)
+    assert(np.allclose(coarse['coords']['x'][:, 0, 0], [0.5, 2.5, 4.5, 6.5]))
+    fine = ovf.read_ovf(fname, resample=dict(shape=(16, 12, 8), method="linear", **options),
+                        order="zyx")
+    assert(fine['data']['value_0'].shape == (8, 12, 16))
+    # Linear data is reproduced exactly between the outer cell centers
+    inside = (slice(1, -1),) * 3
+    c = fine['coords']
+    assert(np.allclose(fine['data']['value_0'][inside],
+                       (c['x'] + 2 * c['y'] - c['z'])[inside]))
+
+def test_watch_ovf_removed(tmp_path, monkeypatch):
+    # Files removed before their header or their data is read are skipped
+    complete = open("reading_tests/df_bin8_rectangular.ovf", "rb").read()
+    for name in ["before_header.ovf", "before_data.ovf", "kept.ovf"]:
+        tmp_path.joinpath(name).write_bytes(complete)
+    complete_header = ovf.ut._complete_header
+    def remove(fname):
+        if fname.name == "before_header.ovf":
+            fname.unlink()
+        header = complete_header(fname)
+        if fname.name == "before_data.ovf":
+            fname.unlink()
+        return header
+    monkeypatch.setattr(ovf.ut, "_complete_header", remove)
+    found = [fname.name for fname, data in ovf.watch_ovf(tmp_path, read_data=True,
+                                                         poll_interval=0.01, timeout=0.05)]
+    assert(found == ["kept.ovf"])
+
+def test_watch_ovf_inotify(tmp_path):
+    inotify_simple = pytest.importorskip("inotify_simple")
+    import threading
+    import time
+    from ovf2io import _watch
+    complete = open("reading_tests/df_bin8_rectangular.ovf", "rb").read()
+    def write_slowly():
+        time.sleep(0.2)
+        with open(tmp_path.joinpath("new.ovf"), "wb") as f:
+            f.write(complete[:len(complete) // 2])
+            f.flush()
+            time.sleep(0.2)
+            f.write(complete[len(complete) // 2:])
+    writer = threading.Thread(target=write_slowly)
+    writer.start()
+    found = [fname.name for fname, header in ovf.watch_ovf(tmp_path, existing=False,
+                                                         poll_interval=0.05, timeout=1.)]
+    writer.join()
+    assert(found == ["new.ovf"])
+    # Events were dropped: every file in the directory is checked
+    class Overflowing:
+        def read(self, timeout):
+            return [inotify_simple.Event(-1, inotify_simple.flags.Q_OVERFLOW, 0, "")]
+    assert(_watch._inotify_names(Overflowing(), tmp_path, 0.) == ["new.ovf"])
+
+def test_valuemultiplier_applied_once(tmp_path):
+    # The data of this file is multiplied by 2; the metadata must then say 1
+    fname = "reading_tests/ovf1_bin4_rectangular.ovf"
+    raw = ovf.read_ovf(fname)
+    assert(raw['metadata']['valuemultiplier'] == 1.)
+    for data in [ovf.read_ovf(fname, workers=2), ovf.open_ovf(fname).to_dict(),
+                 ovf.read_ovf(fname, resample=dict(cellsize=1., method="nearest"))]:
+        assert(data['metadata']['valuemultiplier'] == 1.)
+        assert(np.allclose(data['data']['value_0'], raw['data']['value_0']))
+    lazy = ovf.open_ovf("reading_tests/ovf1_text_rectangular.ovf")
+    assert(np.allclose(lazy['value_1'], y))
+    metadata = ovf.convert_ovf(fname, tmp_path.joinpath("converted.npy"), chunk_bytes=1)
+    assert(metadata['valuemultiplier'] == 1.)
+    with open(tmp_path.joinpath("converted.json")) as f:
+        assert(json.load(f)['valuemultiplier'] == 1.)
+    assert(np.allclose(np.load(tmp_path.joinpath("converted.npy"))[..., 0], raw['data']['value_0']))
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import ovf2io as ovf
 import discretisedfield as df
 from pathlib import Path
@@ -144,3 +145,72 @@ def test_irreg_text_points_given():
     assert(np.allclose(data['data']['value_0'], irreg_data[:,0]))
     assert(np.allclose(data['coords']['x'], irreg_data[:,0]))
 
+
+############ MASKED ########################
+
+def test_masked_roundtrip():
+    mask = rect_data[..., 0] + rect_data[..., 1] > 1
+    for rep in ["text", "bin4", "bin8"]:
+        fname = Path("writing_tests").joinpath(f"test_masked_{rep}.ovf")
+        ovf.write_ovf_masked(rect_data, mask, fname, p0=p0, cellsize=cellsize, representation=rep)
+        irregular = ovf.read_ovf(fname)
+        assert(irregular['metadata']['pointcount'] == np.sum(~mask))
+        data = ovf.read_ovf_masked(fname)
+        assert(np.array_equal(data['mask'], mask))
+        assert(np.allclose(data['data']['value_0'], np.where(mask, 0., rect_data[..., 0])))
+        assert(np.allclose(data['coords']['z'], z))
+
+def test_masked_all_excluded(tmp_path):
+    with pytest.raises(ValueError):
+        ovf.write_ovf_masked(rect_data, np.ones(rect_data.shape[:3], dtype=bool),
+                             tmp_path.joinpath("empty.ovf"))
+    assert(not tmp_path.joinpath("empty.ovf").exists())
+
+############ AXIS ORDER ########################
+
+def test_rect_order():
+    zyx_data = rect_data.transpose(2, 1, 0, 3)
+    for rep in ["text", "bin4", "bin8"]:
+        fname = Path("writing_tests").joinpath(f"test_rect_{rep}_order.ovf")
+        ovf.write_ovf_rectangular(zyx_data, fname, p0=p0, cellsize=cellsize, 
+                                  representation=rep, order="zyx")
+        data = ovf.read_ovf(fname)
+        assert(np.allclose(data['data']['value_0'], x))
+        data = ovf.read_ovf(fname, order="yxz")
+        assert(np.allclose(data['data']['value_1'], y.transpose(1, 0, 2)))
+        assert(np.allclose(data['coords']['x'], x.transpose(1, 0, 2)))
+        assert(not data['data']['value_0'].flags.owndata)
+
+############ ARCHIVE ########################
+
+def test_archive(tmp_path):
+    fname = tmp_path.joinpath("run.ovfa")
+    with ovf.OVFArchive(fname, mode="w") as archive:
+        for t in range(5):
+            archive.append(rect_data * t, time=1e-9 * t, p0=p0, cellsize=cellsize)
+        archive.append(irreg_data, representation="text", points=irreg_data)
+    archive = ovf.OVFArchive(fname)
+    assert(len(archive) == 6)
+    assert(np.allclose(archive.times[:5], 1e-9 * np.arange(5)))
+    assert(np.allclose(archive[3]['data']['value_1'], 3 * y))
+    frames = archive[1:4]
+    assert([np.max(frame['data']['value_0']) for frame in frames] == [1, 2, 3])
+    assert(np.allclose(archive[-1]['coords']['x'], irreg_data[:, 0]))
+    archive.extract(2, tmp_path.joinpath("frame2.ovf"))
+    assert(np.allclose(ovf.read_ovf(tmp_path.joinpath("frame2.ovf"))['data']['value_2'], 2 * z))
+    # The index can be rebuilt from the archive alone
+    tmp_path.joinpath("run.ovfa.idx").unlink()
+    rebuilt = ovf.OVFArchive(fname, mode="a")
+    for field in ["header_offset", "data_offset", "end_offset", "nbytes", "shape"]:
+        assert(np.array_equal(rebuilt.index[field], archive.index[field]))
+    assert(np.allclose(rebuilt.times, archive.times, equal_nan=True))
+
+def test_writer_defaults_shared():
+    # OVFArchive.append relies on the defaults of the _prepare functions matching the writers
+    import inspect
+    for writer, prepare in [(ovf.write_ovf_rectangular, ovf.ut._prepare_rectangular),
+                            (ovf.write_ovf_irregular, ovf.ut._prepare_irregular)]:
+        defaults = {name: p.default for name, p in inspect.signature(prepare).parameters.items()
+                    if p.default is not inspect.Parameter.empty}
+        for name, default in defaults.items():
+            assert(inspect.signature(writer).parameters[name].default == default)